@@ -0,0 +1,40 @@
+'''
+benchmark of the technical indicators in indicator class on synthetic netvalues,
+run it by ``python bench_indicator.py`` in the tests folder, no network is needed
+'''
+import sys
+import timeit
+
+sys.path.insert(0, "../")
+import numpy as np
+import pandas as pd
+from xalpha.indicator import indicator
+
+techindex = ['ma', 'md', 'ema', 'macd', 'mtm', 'roc', 'boll', 'bias', 'rsi', 'kdj', 'wnr', 'dma', 'bbi', 'trix', 'psy']
+
+
+class synthetic(indicator):
+    '''
+    indicator obj with a random walk price table of n days
+    '''
+
+    def __init__(self, n, seed=0):
+        rng = np.random.RandomState(seed)
+        netvalue = 1 + np.abs(np.cumsum(rng.randn(n)) * 0.01)
+        self.price = pd.DataFrame(data={'date': pd.date_range('2000-01-01', periods=n), 'netvalue': netvalue})
+
+
+def bench(n=5000, repeat=5):
+    '''
+    :returns: dict of the best time in seconds of each technical indicator on n days
+    '''
+    obj = synthetic(n)
+    return {name: min(timeit.repeat(getattr(obj, name), number=1, repeat=repeat)) for name in techindex}
+
+
+if __name__ == '__main__':
+    sizes = [1000, 5000, 20000]
+    results = [bench(n) for n in sizes]
+    print('%-6s' % 'days' + ''.join(['%12d' % n for n in sizes]))
+    for name in techindex:
+        print('%-6s' % name + ''.join(['%12.5f' % res[name] for res in results]))
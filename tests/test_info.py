@@ -81,11 +81,77 @@ def test_fund():
     hs300.info()
 
 
+def test_fee_rates():
+    hs300.segment = [[0, 7], [7, 365], [365, 730], [730]]
+    days = list(range(-3, 1000))
+    rates = hs300.fee_rates(days)
+    assert list(rates) == [hs300.feedecision(d) for d in days]
+    assert rates[3] == float(hs300.feeinfo[1].strip('%'))
+    assert rates[-1] == float(hs300.feeinfo[7].strip('%'))
+    hs300.segment = [[0, 7], [3, 365], [365, 730], [730]]  # unordered segments, first match wins
+    assert hs300.fee_rates([5])[0] == float(hs300.feeinfo[1].strip('%'))
+    hs300.segment = [[0, 7], [7, 365], [365, 730], [730]]
+
+
+def test_psy():
+    zzhb.psy()
+    zzhb.rsi()
+    nv = zzhb.price['netvalue']
+    up = sum([nv.iloc[i + 1] > nv.iloc[i] for i in range(len(nv) - 13, len(nv) - 1)])
+    assert zzhb.price['PSY12'].iloc[-1] == up / 12
+    assert zzhb.price['RSI14'].notna().all()
+
+
+def test_feature():
+    columns = list(hs300.price.columns)
+    macd = hs300.feature('macd', fast_window=10)
+    assert list(hs300.price.columns) == columns
+    assert hs300.feature('macd', fast_window=10) is macd
+    hs300.macd(fast_window=10)
+    assert hs300.price['MACD_DIFF_10_26'].equals(macd['MACD_DIFF_10_26'])
+
+
+def test_stream():
+    fund = xa.fundinfo('000311')
+    fund.price = fund.price.iloc[:-10].copy()
+    ema = fund.stream('ema', window=10)
+    assert fund.stream('ema', window=10) is ema
+    fund.stream('macd')
+    fund.stream('boll', window=20)
+    fund.update()
+    assert fund.price['EMA10'].equals(fund.feature('ema', window=10)['EMA10'])
+    assert fund.price['MACD_DEM_12_26'].equals(fund.feature('macd')['MACD_DEM_12_26'])
+    assert abs(fund.price['BOLL_UPPER'] - fund.feature('boll', window=20)['BOLL_UPPER']).max() < 1e-10
+    state = ema.peek([1.0, 1.1])
+    assert state.shape == (2, 1)
+    assert (ema.peek([1.0, 1.1]) == state).all()
+    assert list(fund.peekstreams([1.0])['EMA10']) == list(state[:1, 0])
+    with pytest.raises(Exception):
+        fund.stream('psy')
+
+
+def test_get_info():
+    a = xa.get_info('0000827', kind='index', **ioconf)
+    assert a is xa.get_info('0000827', kind='index', **ioconf)
+    assert a is not xa.get_info('0000827', kind='index', ttl=0, **ioconf)
+    assert a.name == '中证环保'
+
+
 def test_mfundinfo():
     zogqb.bcmkset(xa.cashinfo())
     assert round(zogqb.total_annualized_returns('2018-08-01'), 3) == 0.036
 
 
+def test_mfnetvalue():
+    from xalpha.info import _mfnetvalue
+    import numpy as np
+    rates = [0.5, 1.2, 0.8]
+    nv = [1.01]
+    for r in rates:
+        nv.append(nv[-1] * (1 + r * 1e-4))
+    assert list(_mfnetvalue(1.01, np.array(rates) * 1e-4)) == nv[1:]
+
+
 def test_evaluate():
     comp = xa.evaluate(ca, zzhb, hs300)
     comp.v_netvalue(end='2018-08-01')
@@ -94,6 +160,28 @@ def test_evaluate():
     assert round(comp2.correlation_table('2018-08-01').iloc[0, 1], 3) == 0.064
 
 
+def test_panel():
+    from xalpha.indicator import indicator
+    comp = xa.evaluate(zzhb, hs300, start='2018-01-02')
+    p = xa.panel(comp.totprice)
+    p.ma(20)
+    p.ma(60)
+    p.macd()
+    assert p['MA20'].shape == (len(comp.totprice), 2)
+    single = indicator()
+    single.price = comp.totprice[['date', hs300.code]].rename(columns={hs300.code: 'netvalue'})
+    single.macd()
+    assert list(p['MACD_DEM_12_26'][hs300.code]) == list(single.price['MACD_DEM_12_26'])
+    cross = p.cross('MA20', 'MA60')
+    assert cross.shape == p['MA20'].shape
+    assert (cross.iloc[:60] == 0).all().all()
+    assert set(cross.values.ravel()) <= {-1, 0, 1}
+    with pytest.raises(NotImplementedError):
+        p.bcmkset(zzhb)
+    with pytest.raises(NotImplementedError):
+        p.stream('ema')
+
+
 def delete_csvlines(path, end=1):
     df = pd.read_csv(path)
     for _ in range(5):
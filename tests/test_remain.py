@@ -2,6 +2,8 @@ import sys
 
 sys.path.insert(0, "../")
 from xalpha import remain
+from xalpha.cons import myround, tocents, fromcents
+import numpy as np
 import pandas as pd
 import pytest
 
@@ -32,3 +34,14 @@ def test_trans():
     assert remain.trans(rem, 1.2, '2020-01-01')[2][1] == 12.72
     assert rem[1][1] == 30
     assert len(remain.trans([], 0, '2018-01-01')) == 0
+
+
+def test_myround():
+    assert myround(2.675) == 2.68
+    assert myround(1.005) == 1.01
+    assert myround(-0.285) == -0.29
+    assert myround(3.149, 2) == 3.14
+    assert myround(0.29, 2) == 0.29
+    nums = np.random.RandomState(0).uniform(-1e4, 1e4, 1000).round(3).tolist() + [1.005, 2.675, 0.29]
+    for label in [1, 2]:
+        assert fromcents(tocents(nums, label)).tolist() == [myround(num, label) for num in nums]
@@ -2,6 +2,9 @@ import sys
 
 sys.path.insert(0, "../")
 import xalpha as xa
+from xalpha.cons import xirr, batchxirr
+from xalpha.indicator import indicator
+from xalpha.trade import cashledger
 import pytest
 import pandas as pd
 
@@ -20,6 +23,128 @@ def test_trade():
     cm_t.v_tradevolume(freq='M')
 
 
+def test_snapshot(tmp_path, monkeypatch):
+    prefix = str(tmp_path) + '/'
+    xa.trade(cm, statb, snapshot=prefix)
+    assert (tmp_path / '164818.pkl').exists()
+    with monkeypatch.context() as m:
+        m.setattr(xa.trade, '_arrange', lambda self: pytest.fail('the snapshot is not loaded'))
+        cm_t2 = xa.trade(cm, statb, snapshot=prefix)
+    assert cm_t2.cftable.equals(cm_t.cftable)
+    assert list(cm_t2.remtable.rem) == list(cm_t.remtable.rem)
+    statc = statb.copy()
+    statc.loc[len(statc) - 1, '164818'] = 100
+    cm_t3 = xa.trade(cm, statc, snapshot=prefix)
+    assert cm_t3.cftable.equals(xa.trade(cm, statc).cftable)
+
+
+def test_extend():
+    cm_t4 = xa.trade(cm, statb.iloc[:-1])
+    cm_t4.extend(statb.iloc[-1:])
+    assert cm_t4.cftable.equals(cm_t.cftable)
+    assert cm_t4.briefdailyreport('2018-07-29') == cm_t.briefdailyreport('2018-07-29')
+
+
+def test_precision_fast():
+    fast = xa.trade(cm, statb, precision='fast')
+    assert fast.cftable['date'].equals(cm_t.cftable['date'])
+    bound = 0.01 * len(cm_t.cftable)
+    assert abs(fast.cftable['share'].sum() - cm_t.cftable['share'].sum()) < bound
+    report, freport = cm_t.dailyreport('2018-07-29').iloc[0], fast.dailyreport('2018-07-29').iloc[0]
+    assert abs(report['基金收益总额'] - freport['基金收益总额']) < bound * (1 + report['当日净值'])
+    allin = xa.policy.buyandhold(cm, '2015-06-01')
+    assert abs(allin.backtest(precision='fast').xirrrate('2018-07-01') - allin.backtest().xirrrate('2018-07-01')) < 1e-4
+
+
+def test_precision_fast_edges():
+    cash = xa.cashinfo(start='2018-01-01')
+    cash.price = cash.price[cash.price['date'] <= '2018-08-01']
+    st = pd.DataFrame({'date': pd.to_datetime(['2018-03-04', '2018-07-02']), 'mf': [1000.05, -100]})
+    exact, fast = xa.trade(cash, st), xa.trade(cash, st, precision='fast')
+    assert fast.cftable.iloc[0]['cash'] == exact.cftable.iloc[0]['cash'] == -1000.05
+    assert fast.cftable['date'].equals(exact.cftable['date'])
+    st.loc[1, 'date'] = pd.Timestamp('2018-09-03')
+    for precision in ['exact', 'fast']:
+        with pytest.raises(Exception) as excinfo:
+            xa.trade(cash, st, precision=precision)
+        assert str(excinfo.value) == 'no netvalue of mf on or after 2018-09-03'
+
+
+def test_batchtrade():
+    trades = xa.batchtrade([cm], statb)
+    assert trades[0].cftable.equals(cm_t.cftable)
+    assert list(trades[0].remtable.rem) == list(cm_t.remtable.rem)
+
+
+def test_xirr():
+    cashflow = [(pd.Timestamp('2018-01-01'), -100), (pd.Timestamp('2019-01-01'), 110)]
+    assert round(xirr(cashflow), 6) == 0.1
+    assert round(xirr(cashflow, guess=-0.9), 6) == 0.1
+    cashflow2 = [(pd.Timestamp('2017-01-01'), -100), (pd.Timestamp('2017-06-01'), -50),
+                 (pd.Timestamp('2019-01-01'), 120)]
+    rates = batchxirr([cashflow, cashflow2])
+    assert round(rates[0], 6) == 0.1
+    assert round(rates[1], 8) == round(xirr(cashflow2), 8)
+    tot = xa.mul(status=statb)
+    rates = tot.xirrrates('2018-08-04')
+    for fund in tot.fundtradeobj:
+        assert round(rates[fund.aim.code], 6) == round(fund.xirrrate('2018-08-04'), 6)
+
+
+def test_xirr_series():
+    dates = pd.date_range('2017-01-01', '2018-08-01', freq='W')
+    s = cm_t.xirr_series(dates)
+    for date in dates[::10]:
+        assert round(s[date], 6) == round(cm_t.xirrrate(date), 6)
+    tot = xa.mul(status=statb)
+    s = tot.xirr_series(dates[::-1])
+    assert round(s['2018-07-29'], 6) == round(tot.xirrrate('2018-07-29'), 6)
+
+
+def test_pnl_attribution():
+    tot = xa.mul(status=statb)
+    df = tot.pnl_attribution('2017-01-01', '2018-08-01')
+    fund = tot.fundtradeobj[0]
+    code = fund.aim.code
+    before = fund.briefdailyreport('2016-12-31').get('currentvalue', 0) + \
+             fund.cftable[fund.cftable['date'] <= '2016-12-31']['cash'].sum()
+    after = fund.briefdailyreport('2018-08-01').get('currentvalue', 0) + \
+            fund.cftable[fund.cftable['date'] <= '2018-08-01']['cash'].sum()
+    assert round(df[code].values.sum(), 2) == round(after - before, 2)
+    chunks = pd.concat(tot.pnl_attribution('2017-01-01', '2018-08-01', chunksize=50))
+    assert chunks.index.equals(df.index)
+    assert (chunks - df).abs().values.max() < 1e-8
+    funds = {fund.aim.code: fund for fund in tot.fundtradeobj}
+    # purchase of 225 on 2017-10-17, the fee is the purchase fee up to the rounding of cash and share
+    fund = funds['100032']
+    netvalue = fund.aim.price[fund.aim.price['date'] == '2017-10-17'].iloc[0].netvalue
+    purchasefee = 225 - 225 / (1 + fund.aim.rate * 1e-2)
+    assert abs(df.loc['2017-10-17', ('100032', 'fee')] + purchasefee) < 0.01 * (1 + netvalue)
+    # redemption on 2018-07-26 realizes the profit
+    assert df.loc['2018-07-26', ('003376', 'realized')] != 0
+    # dividend is the fenhong per share times the share held before the day, in cash or reinvested
+    checked = 0
+    for code, fund in funds.items():
+        for date in fund.aim.fenhongdate:
+            held = fund.cftable[fund.cftable['date'] < date]['share'].sum()
+            if date not in df.index or held <= 0:
+                continue
+            row = fund.aim.price[fund.aim.price['date'] == date].iloc[0]
+            assert abs(df.loc[date, (code, 'dividend')] - held * row.comment) < 0.01 * (1 + row.netvalue)
+            checked += 1
+    assert checked > 0
+
+
+def test_iter_states():
+    tot = xa.mul(status=statb)
+    code = tot.fundtradeobj[0].aim.code
+    for state in tot.iter_states('2018-07-20', '2018-08-01'):
+        report = tot.fundtradeobj[0].dailyreport(state['date'])
+        assert state['share'][code] == report.iloc[0]['持有份额']
+        assert state['value'][code] == report.iloc[0]['基金现值']
+        assert state['cost'][code] == report.iloc[0]['基金持有成本']
+
+
 def test_mul():
     with pytest.raises(Exception) as excinfo:
         cm_m = xa.mulfix(cm_t, totmoney=200)
@@ -32,10 +157,29 @@ def test_mul():
     cm_m.bcmkset(xa.indexinfo('1399971'), start='2016-09-28')
     assert round(cm_m.xirrrate('2018-07-29'), 3) == -0.129
     assert round(cm_m.sharpe('2018-07-30'), 3) == -1.734
+    assert list(cm_m._rates(cm_m.alignedprice, '2018-07-30')) == indicator.ratedaily(cm_m.alignedprice, '2018-07-30')
     cm_m.v_netvalue(benchmark=False)
     assert round(cm_m.total_return('2018-07-01'), 3) == -0.209
     assert round(cm_m.benchmark_volatility('2018-07-22'), 3) == 0.192
     assert round(cm_m.max_drawdown('2018-08-01')[2], 2) == -0.24
+    report = cm_m.metrics_report(['2018-07-22', '2018-07-30', '2018-08-01'])
+    assert round(report.iloc[1]['sharpe'], 3) == -1.734
+    assert round(report.iloc[0]['benchmark_volatility'], 3) == 0.192
+    assert report.iloc[2]['max_drawdown'] == cm_m.max_drawdown('2018-08-01')[2]
+    rolling = cm_m.rolling_metrics(window=len(cm_m.alignedprice) - 1)
+    assert round(rolling.iloc[-1]['beta'], 8) == round(cm_m.beta(rolling.iloc[-1]['date']), 8)
+    assert rolling.iloc[:-1]['volatility'].isna().all()
+    top = cm_m.top_drawdowns(3, '2018-08-01')
+    assert tuple(top.iloc[0][['start', 'end', 'drawdown']]) == cm_m.max_drawdown('2018-08-01')
+    assert cm_m.drawdown_series('2018-08-01')['drawdown'].min() == top.iloc[0]['drawdown']
+    price = cm_m.price
+    cm_m.bcmkset({'cyb': xa.indexinfo('1399971'), 'cash': xa.cashinfo()}, start='2016-09-28')
+    assert cm_m.price is price
+    assert list(cm_m.alignedprice['date']) == list(cm_m.bmprices['cash']['date'])
+    assert cm_m.beta('2018-07-30') == cm_m.beta('2018-07-30', benchmark='cyb')
+    assert cm_m.information_ratio('2018-07-30', benchmark='cash') < 0
+    with pytest.raises(Exception):
+        cm_m.alpha('2018-07-30', benchmark='zz500')
     cm_m.v_tradevolume()
 
 
@@ -44,10 +188,32 @@ def test_mulfix():
     assert tot.v_positions().options['legend'][0]['data'][1] == '富国中证红利指数增强'
     assert tot.v_positions_history('2017-01-01').options['legend'][0]['data'][-1] == '货币基金'
     assert round(tot.combsummary('2018-08-04').iloc[0]['投资收益率'], 1) == 1.0
+    assert round(tot.unitvalue('2018-08-04') * 5000, 2) == round(
+        sum([fund.briefdailyreport('2018-08-04').get('currentvalue', 0) for fund in tot.fundtradeobj]), 2)
+    history = tot.summary_history(['2018-08-04', '2017-12-29'])
+    assert history.iloc[0]['日期'] == pd.Timestamp('2017-12-29')
+    assert history[history['日期'] == '2018-08-04'].drop('日期', axis=1).reset_index(drop=True).equals(
+        tot.combsummary('2018-08-04').reset_index(drop=True))
     eva = tot.evaluation()
     assert round(eva.correlation_table(end='2018-07-30').iloc[2, 4], 3) == 0.095
 
 
+def test_cashledger():
+    cashobj = xa.cashinfo(interest=0, start='2014-01-01')  # netvalue is always 1, so share is the cash balance
+    tot = xa.mulfix(status=statb, totmoney=5000, cashobj=cashobj)
+    fundcftable = tot._mergecftb(tot.fundtradeobj[:-1])
+    ledger = tot.fundtradeobj[-1]
+    assert list(ledger.cftable['date']) == list(fundcftable['date'])
+    balance = (5000 + fundcftable['cash'].cumsum()).round(2)
+    assert list(ledger.cftable['share'].cumsum().round(2)) == list(balance)
+    assert [sum(lot[1] for lot in rem) for rem in ledger.remtable.rem] == list(balance)
+    # the cash ending in 5 fen is not regarded as a fenhong reinvest mark
+    ledger = cashledger(cashobj, 1000, pd.DataFrame({'date': pd.to_datetime(['2018-01-02', '2018-01-03']),
+                                                     'cash': [-500, 12.35]}))
+    assert list(ledger.cftable['cash']) == [-500, -12.35]
+    assert ledger.remtable.iloc[-1].rem == [[pd.Timestamp('2018-01-02'), 512.35]]
+
+
 def test_policy_buyandhold():
     allin = xa.policy.buyandhold(cm, '2015-06-01')
     cm_t2 = xa.trade(cm, allin.status)
@@ -79,6 +245,8 @@ def test_policy_indicator_cross():
     cm.bbi()
     techst = xa.policy.indicator_cross(cm, col=['netvalue', 'BBI'], start='2018-01-01', end='2018-07-07')
     cm_tt = xa.trade(cm, techst.status)
+    techst2 = xa.policy.indicator_cross(cm, col=['netvalue', {'indicator': 'bbi'}], start='2018-01-01', end='2018-07-07')
+    assert techst2.status.equals(techst.status)
     assert round(cm_tt.dailyreport('2018-07-09').iloc[0].loc['换手率'], 1) == 14.1
 
 
@@ -89,3 +257,16 @@ def test_policy_indicator_points():
                                     sell=[(0.4, 1), (0.3, 1)], buylow=False)
     zz500_t = xa.trade(zz500, st.status)
     assert zz500_t.dailyreport('2018-05-01').iloc[0].loc['基金收益总额'] == -6302.26
+
+
+def test_policy_status_gen():
+    class monthly(xa.policy.policy):
+        def status_gen(self, date):
+            if date.day == 1:
+                return self.totmoney
+            return 0
+
+    mo = monthly(cm, '2018-01-02', '2018-06-30', totmoney=1000)
+    auto = xa.policy.scheduled(cm, 1000, pd.date_range('2018-02-01', '2018-06-30', freq='MS'))
+    assert list(mo.status['date']) == list(auto.status['date'])
+    assert mo.status[cm.code].equals(auto.status[cm.code])
@@ -3,10 +3,11 @@ __author__ = 'refraction-ray'
 __name__ = 'xalpha'
 
 from xalpha.record import record
-from xalpha.info import fundinfo, indexinfo, cashinfo, mfundinfo
+from xalpha.info import fundinfo, indexinfo, cashinfo, mfundinfo, get_info, set_info_registry
 from xalpha.evaluate import evaluate
-from xalpha.trade import trade
+from xalpha.indicator import panel
+from xalpha.trade import trade, batchtrade
 from xalpha.multiple import mul, mulfix
-from xalpha.realtime import rfundinfo, review
+from xalpha.realtime import rfundinfo, rtindicator, review
 import xalpha.policy
 
@@ -4,8 +4,10 @@ basic constants and functions
 '''
 
 import datetime as dt
+import math
 from decimal import Decimal
 from scipy import optimize
+import numpy as np
 import pandas as pd
 
 # date obj of today
@@ -41,9 +43,117 @@ def xnpv(rate, cashflows):
         and cash inflows (returns) are positive amounts.
     :returns: a single float value which is the NPV of the given cash flows
     '''
-    chron_order = sorted(cashflows, key=lambda x: x[0])
-    t0 = chron_order[0][0]
-    return sum([cf / (1 + rate) ** ((t - t0).days / 365.0) for (t, cf) in chron_order])
+    times, amounts = _cashflowarrays(cashflows)
+    with np.errstate(all='ignore'):
+        return float(_xnpv(rate, times, amounts)[0])
+
+
+def _yearfrac(dates, start=None):
+    '''
+    year fractions of dates counted from start (the earliest date by default), in the unit of 365 natural days
+
+    :param dates: array-like of datetime objects
+    :param start: datetime object or None
+    :returns: np.array of float
+    '''
+    dates = pd.DatetimeIndex(dates)
+    if start is None:
+        start = dates.min()
+    return (dates - start).days.values / 365.0
+
+
+def _cashflowarrays(cashflows):
+    '''
+    transform the cashflow list of xnpv into the year fraction array and amount array
+    '''
+    times = _yearfrac([t for t, _ in cashflows])
+    amounts = np.array([cf for _, cf in cashflows], dtype='float64')
+    return times, amounts
+
+
+def _xnpv(rate, times, amounts):
+    '''
+    npv and its derivative on rate evaluated in numpy, invalid values for rate <= -1 are left to the callers.
+    times and amounts can be 2d arrays, where each row is one set of cashflows (padded with zero amounts),
+    then rate is an array with one rate for each row.
+
+    :returns: tuple of (npv, dnpv/drate)
+    '''
+    rate = np.asarray(rate, dtype='float64')
+    disc = amounts * (1 + rate[..., None]) ** -times
+    return disc.sum(axis=-1), -(times * disc).sum(axis=-1) / (1 + rate)
+
+
+def _xirrnewton(times, amounts, guess, tol=1.48e-8, maxiter=50):
+    '''
+    newton iterations with the analytic derivative, vectorized over rows of cashflows
+
+    :returns: np.array of rates, nan for rows that fail to converge
+    '''
+    rate = np.array(np.broadcast_to(np.asarray(guess, dtype='float64'), np.shape(amounts)[:-1]))
+    todo = np.ones(rate.shape, dtype=bool)
+    with np.errstate(all='ignore'):
+        for _ in range(maxiter):
+            f, df = _xnpv(rate, times, amounts)
+            newrate = rate - f / df
+            converged = (f == 0) | (np.abs(newrate - rate) < tol)
+            rate = np.where(todo & (f != 0), newrate, rate)
+            todo = todo & ~converged
+            if not todo.any():
+                break
+    rate[todo | ~np.isfinite(rate) | (rate <= -1)] = np.nan
+    return rate
+
+
+# rates to search for a sign change of npv when newton fails
+_xirrgrid = np.array([-0.9999, -0.999, -0.99, -0.95, -0.9, -0.8, -0.6, -0.4, -0.2, -0.1, 0., 0.1, 0.2, 0.4, 0.6,
+                      1., 2., 4., 10., 100., 1000.])
+
+
+def _xirrbracket(times, amounts, guess):
+    '''
+    find the root by brentq in a bracket where npv changes its sign, the bracket nearest to guess is chosen
+
+    :returns: float, nan if there is no sign change of npv at all
+    '''
+    with np.errstate(all='ignore'):
+        f = _xnpv(_xirrgrid, times, amounts)[0]
+        i = np.nonzero(np.sign(f[:-1]) * np.sign(f[1:]) < 0)[0]
+        if len(i) == 0:
+            return np.nan
+        i = i[np.argmin(np.abs(_xirrgrid[i] - guess))]
+        return optimize.brentq(lambda r: _xnpv(r, times, amounts)[0], _xirrgrid[i], _xirrgrid[i + 1])
+
+
+def _xirr(times, amounts, guess=0.1):
+    '''
+    solve xirr from year fraction and amount arrays, 2d arrays are solved row by row in one go
+
+    :returns: float or np.array of floats
+    '''
+    rate = _xirrnewton(times, amounts, guess)
+    if np.ndim(rate) == 0:
+        return float(rate) if not np.isnan(rate) else _xirrbracket(times, amounts, guess)
+    guess = np.broadcast_to(np.asarray(guess, dtype='float64'), rate.shape)
+    for i in np.nonzero(np.isnan(rate))[0]:
+        rate[i] = _xirrbracket(times[i], amounts[i], guess[i])
+    return rate
+
+
+def _stackflows(flows):
+    '''
+    stack cashflow arrays of different length into 2d arrays, padded with zero amounts which contribute nothing
+
+    :param flows: list of tuples (year fractions, amounts)
+    :returns: tuple of 2d np.array, (times, amounts)
+    '''
+    n = max([len(amounts) for _, amounts in flows])
+    times = np.zeros((len(flows), n))
+    amounts = np.zeros((len(flows), n))
+    for i, (t, a) in enumerate(flows):
+        times[i, :len(t)] = t
+        amounts[i, :len(a)] = a
+    return times, amounts
 
 
 def xirr(cashflows, guess=0.1):
@@ -56,9 +166,93 @@ def xirr(cashflows, guess=0.1):
         and cash inflows (returns) are positive amounts.
     :param guess: floating number, a guess at the xirr rate solution to be used
         as a starting point for the numerical solution
-    :returns: the IRR as a single floating number
+    :returns: the IRR as a single floating number, nan if the npv never changes its sign
+    '''
+    times, amounts = _cashflowarrays(cashflows)
+    return _xirr(times, amounts, guess)
+
+
+def batchxirr(cashflowsets, guess=0.1):
+    '''
+    calculate the Internal Rate of Return for many sets of cashflows in one call,
+    the newton iterations run on all the sets at the same time.
+
+    :param cashflowsets: list of cashflows, each of them is in the form of the input of xirr
+    :param guess: floating number or list of floating numbers for each set of cashflows
+    :returns: np.array of IRR for each set of cashflows
+    '''
+    if len(cashflowsets) == 0:
+        return np.array([])
+    return _xirr(*_stackflows([_cashflowarrays(cashflows) for cashflows in cashflowsets]), guess=guess)
+
+
+# label 2 is for jingshunchangcheng... who just omit the overflow share behind 2 decimal
+_roundingmode = {1: 'ROUND_HALF_UP', 2: 'ROUND_DOWN'}
+
+
+def _decimalround(num, label=1):
+    '''
+    the reference implementation of rounding: decimal rounding on the shortest repr of the float
+
+    :returns: Decimal with two decimals
+    '''
+    return Decimal(str(num)).quantize(Decimal('0.01'), rounding=_roundingmode[label])
+
+
+def _undecided(y, frac, label):
+    '''
+    whether the float rounding of y=|num|*100 may disagree with the decimal rounding on the repr of num,
+    since y carries a relative error of at most a few ulps, only values close to the rounding boundary are in doubt
+
+    :param y: np.array, abs of the number times 100
+    :param frac: np.array, y - floor(y)
+    :param label: 1 for round half up, 2 for round down
+    :returns: np.array of bool
+    '''
+    tol = np.maximum(1e-9, y * 1e-13)
+    if label == 1:
+        return np.abs(frac - 0.5) <= tol
+    return (frac <= tol) | (frac >= 1 - tol)
+
+
+def tocents(num, label=1):
     '''
-    return optimize.newton(lambda r: xnpv(r, cashflows), guess)
+    vectorized exact rounding to 2 decimals, giving the integer number of cents (or hundredths of a share).
+    The result is the same as myround bit by bit, namely decimal ROUND_HALF_UP or ROUND_DOWN on the repr of floats,
+    while only the rare numbers close to the rounding boundary fall back to Decimal.
+
+    :param num: float or array-like of floats
+    :param label: integer 1 or 2, 1 for round half up while 2 for always round down, both away from zero symmetric
+    :returns: np.array of np.int64 with the same shape as num, note integers have no negative zero
+    '''
+    a = np.asarray(num, dtype='float64')
+    y = np.abs(a) * 100
+    with np.errstate(invalid='ignore'):
+        fallback = ~np.isfinite(y) | (y >= 2 ** 52)
+        y = np.where(fallback, 0, y)
+        floor = np.floor(y)
+        frac = y - floor
+        if label == 1:
+            cents = floor + (frac >= 0.5)
+        else:
+            cents = floor
+        fallback = fallback | _undecided(y, frac, label)
+    cents = (np.sign(a) * cents).astype('int64')
+    if fallback.any():
+        idx = np.nonzero(fallback)
+        cents[idx] = [int(_decimalround(float(x), label).scaleb(2)) for x in a[idx]]
+    return cents
+
+
+def fromcents(cents):
+    '''
+    convert the number of cents back to float, the division by 100 is correctly rounded,
+    so the float is the same as float(Decimal) of the 2 decimal number
+
+    :param cents: int or np.array of int
+    :returns: float or np.array of float
+    '''
+    return np.asarray(cents) / 100.
 
 
 def myround(num, label=1):
@@ -69,11 +263,17 @@ def myround(num, label=1):
     :param label: integer 1 or 2, 1 for round half up while 2 for always round down
     :returns: the float number after rounding, with two decimals
     '''
-    if label == 1:
-        res = float(Decimal(str(num)).quantize(Decimal('0.01'), rounding='ROUND_HALF_UP'))
-    elif label == 2:  # for jingshunchangcheng... who just omit the overflow share behind 2 decimal
-        res = float(Decimal(str(num)).quantize(Decimal('0.01'), rounding='ROUND_DOWN'))
-    return res
+    y = abs(num) * 100
+    if y < 4503599627370496.0:  # fast path in float for |y| < 2**52, nan and inf are excluded as well
+        floor = math.floor(y)
+        frac = y - floor
+        tol = y * 1e-13 if y > 1e4 else 1e-9  # the same tolerance as _undecided
+        if label == 1:
+            if abs(frac - 0.5) > tol:
+                return math.copysign((floor + (frac > 0.5)) / 100., num)
+        elif tol < frac < 1 - tol:
+            return math.copysign(floor / 100., num)
+    return float(_decimalround(num, label))
 
 
 def convert_date(date):
@@ -3,22 +3,187 @@
 module for implementation of indicator class, which is designed as MinIn for systems with netvalues
 '''
 
+import copy
+from collections import deque
+
+import numpy as np
 import pandas as pd
 from pyecharts.charts import Line
 
-from xalpha.cons import yesterdayobj, opendate
+from xalpha.cons import yesterdayobj, opendate, convert_date
+
+
+class _ewmstate():
+    '''
+    state of ``ewm(span=window).mean()`` with the default options of pandas, which is advanced by one value a time
+    with the same float operations as pandas, so that the streamed values are identical to the batch ones
+    '''
+
+    def __init__(self, window):
+        com = (window - 1) / 2.0
+        self.factor = 1. - 1. / (1. + com)
+        self.weighted = None
+        self.oldwt = 1.
+        self.nobs = 0
+
+    def push(self, cur):
+        isobs = cur == cur
+        self.nobs += isobs
+        if self.weighted is None:
+            self.weighted = cur
+        elif self.weighted == self.weighted:
+            self.oldwt *= self.factor
+            if isobs:
+                if self.weighted != cur:
+                    self.weighted = (self.oldwt * self.weighted + cur) / (self.oldwt + 1.)
+                self.oldwt += 1.
+        elif isobs:
+            self.weighted = cur
+        return self.weighted if self.nobs >= 1 else np.nan
+
+
+class _rollstate():
+    '''
+    state of a rolling window, the window is valid only when it is full and has no nan inside
+    '''
+
+    def __init__(self, window):
+        self.values = deque(maxlen=window)
+        self.nans = deque(maxlen=window)
+
+    def push(self, cur):
+        self.values.append(cur)
+        self.nans.append(cur != cur)
+        return len(self.values) == self.values.maxlen and not any(self.nans)
+
+    def mean(self):
+        return np.mean(self.values)
 
 
-def _upcount(ls):
+class _stream():
     '''
-    count the ratio of upmove days by given a list
+    base class of streaming technical indicators, which keep the recursive states of the indicator
+    (ewm accumulators and rolling windows) and give the values of new days in O(1) or O(window) time each
     '''
-    count = 0
-    for i in range(len(ls) - 1):
-        # somehow after pandas 0.23(22?), the input is a series(dataframe?) and old list supporting syntax are illegal
-        if ls.iloc[i + 1] > ls.iloc[i]:
-            count += 1
-    return count / (len(ls) - 1)
+    columns = []
+
+    def update(self, values):
+        '''
+        advance the states by new observations
+
+        :param values: list or np.array of new values of col, in the order of time
+        :returns: np.array of shape (len(values), len(columns)), the indicator values of the new days
+        '''
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rows = [self._push(np.float64(v)) for v in values]
+        return np.array(rows, dtype=float).reshape(-1, len(self.columns))
+
+    def peek(self, values):
+        '''
+        the same as update, while the states are left untouched, eg. for the realtime estimate within the day
+        '''
+        return copy.deepcopy(self).update(values)
+
+
+class emastream(_stream):
+    '''
+    streaming version of indicator.ema, the values are identical to the batch ones
+    '''
+
+    def __init__(self, window=5, col='netvalue'):
+        self.col = col
+        self.columns = ['EMA' + str(window)]
+        self._ema = _ewmstate(window)
+
+    def _push(self, cur):
+        return (self._ema.push(cur),)
+
+
+class macdstream(_stream):
+    '''
+    streaming version of indicator.macd, the values are identical to the batch ones
+    '''
+
+    def __init__(self, fast_window=12, slow_window=26, signal_window=9, col='netvalue'):
+        self.col = col
+        suffix = '_' + str(fast_window) + '_' + str(slow_window)
+        self.columns = ['MACD_DIFF' + suffix, 'MACD_DEM' + suffix, 'MACD_OSC' + suffix]
+        self._fast = _ewmstate(fast_window)
+        self._slow = _ewmstate(slow_window)
+        self._signal = _ewmstate(signal_window)
+
+    def _push(self, cur):
+        diff = self._fast.push(cur) - self._slow.push(cur)
+        dem = self._signal.push(diff)
+        return diff, dem, diff - dem
+
+
+class rsistream(_stream):
+    '''
+    streaming version of indicator.rsi, the values are identical to the batch ones
+    '''
+
+    def __init__(self, window=14, col='netvalue'):
+        self.col = col
+        self.columns = ['RSI' + str(window)]
+        self._last = None
+        self._up = _ewmstate(window)
+        self._down = _ewmstate(window)
+
+    def _push(self, cur):
+        if self._last is None:
+            up, down = 0., 0.
+        else:
+            move = cur - self._last
+            up, down = (move, 0.) if move > 0 else (0., -move)
+        self._last = cur
+        posdi = self._up.push(np.float64(up))
+        negdi = self._down.push(np.float64(down))
+        return (posdi / (posdi + negdi),)
+
+
+class bollstream(_stream):
+    '''
+    streaming version of indicator.boll, the values agree with the batch ones up to float rounding
+    '''
+
+    def __init__(self, window=10, deviation=2, col='netvalue'):
+        self.col = col
+        self.columns = ['MA' + str(window), 'MD' + str(window), 'BOLL_UPPER', 'BOLL_LOWER']
+        self.deviation = deviation
+        self._roll = _rollstate(window)
+
+    def _push(self, cur):
+        if not self._roll.push(cur):
+            return np.nan, np.nan, np.nan, np.nan
+        ma = self._roll.mean()
+        md = np.std(self._roll.values, ddof=1) if len(self._roll.values) > 1 else np.nan
+        return ma, md, ma + self.deviation * md, ma - self.deviation * md
+
+
+class kdjstream(_stream):
+    '''
+    streaming version of indicator.kdj, the values agree with the batch ones up to float rounding
+    '''
+
+    def __init__(self, rsv_window=9, k_window=3, d_window=3, col='netvalue'):
+        self.col = col
+        self.columns = ['KDJ_K', 'KDJ_D', 'KDJ_J']
+        self._price = _rollstate(rsv_window)
+        self._rsv = _rollstate(k_window)
+        self._k = _rollstate(d_window)
+
+    def _push(self, cur):
+        rsv = np.nan
+        if self._price.push(cur):
+            low, high = min(self._price.values), max(self._price.values)
+            rsv = (cur - low) / (high - low)
+        k = self._rsv.mean() if self._rsv.push(rsv) else np.nan
+        d = self._k.mean() if self._k.push(k) else np.nan
+        return k, d, 3 * k - 2 * d
+
+
+_streamclass = {'ema': emastream, 'macd': macdstream, 'rsi': rsistream, 'boll': bollstream, 'kdj': kdjstream}
 
 
 class indicator():
@@ -34,9 +199,13 @@ class indicator():
         '''
         Once you want to utilize the indicator tool box for analysis, first run bcmkset function to set
         the benchmark, otherwise most of the functions would raise error.
+        The price tables of the aim and all benchmarks are aligned once on their common dates after start,
+        and kept as self.alignedprice and self.bmprices, the price tables themselves are left untouched.
 
-        :param infoobj: info obj, whose netvalue are used as benchmark
-        :param start: datetime obj, indicating the starting date of all analysis.
+        :param infoobj: info obj, whose netvalue are used as benchmark, or a dict of several info objs keyed by names,
+            eg. {'hs300': hs300, 'zz500': zz500, 'bond': bond}, the first one is the default benchmark, and the others
+            are chosen by the benchmark parameter of the metric functions. A single info obj is keyed by its code.
+        :param start: datetime obj or string, indicating the starting date of all analysis.
             Note if use default start, there may be problems for some fundinfo obj, as lots of
             funds lack netvalues of several days from our API, resulting unequal length between
             benchmarks and fund net values.
@@ -46,17 +215,32 @@ class indicator():
         self._pricegenerate()
         if start is None:
             self.start = self.price.iloc[0].date
-        elif isinstance(start, str):
-            self.start = pd.Timestamp.strptime(start, '%Y-%m-%d')
-        self.benchmark = infoobj
+        else:
+            self.start = convert_date(start)
+        if not isinstance(infoobj, dict):
+            infoobj = {infoobj.code: infoobj}
+        self.benchmarks = infoobj
+        self.benchmark = list(infoobj.values())[0]
 
         self.riskfree = riskfree
-        self.bmprice = self.benchmark.price[self.benchmark.price['date'] >= self.start]
-        self.price = self.price[self.price['date'] >= self.start]
-        self.bmprice = self.bmprice[self.bmprice['date'].isin(self.price['date'])]
-        self.price = self.price[self.price['date'].isin(self.bmprice['date'])]
+        dates = self.price['date'][self.price['date'] >= self.start]
+        for bm in self.benchmarks.values():
+            dates = dates[dates.isin(bm.price['date'])]
+        self.alignedprice = self.price[self.price['date'].isin(dates)]
+        self.bmprices = {key: bm.price[bm.price['date'].isin(dates)] for key, bm in self.benchmarks.items()}
+        self.bmprice = self.bmprices[list(infoobj)[0]]
+        self._ratecache = {}
 
-    # the price data is removed from the infoobj before start date
+    def _bmprice(self, benchmark=None):
+        '''
+        :param benchmark: key of the benchmark in bcmkset, default the first one
+        :returns: the aligned price table of the benchmark
+        '''
+        if benchmark is None:
+            return self.bmprice
+        if benchmark not in self.bmprices:
+            raise Exception('no such benchmark: %s' % benchmark)
+        return self.bmprices[benchmark]
 
     def _pricegenerate(self):
         '''
@@ -64,19 +248,19 @@ class indicator():
         '''
         if getattr(self, 'price', None) is None:
             times = pd.date_range(self.totcftable.iloc[0].date, yesterdayobj())
-            netvalue = []
-            for date in times:
-                netvalue.append(self.unitvalue(date))
+            netvalue = self._unitvalues(times)
             self.price = pd.DataFrame(data={'date': times, 'netvalue': netvalue})
             self.price = self.price[self.price['date'].isin(opendate)]
 
-    def comparison(self, date=yesterdayobj()):
+    def comparison(self, date=yesterdayobj(), benchmark=None):
         '''
+        :param benchmark: key of the benchmark in bcmkset, default the first one
         :returns: tuple of two pd.Dataframe, the first is for aim and the second if for the benchmark index
             all netvalues are normalized and set equal 1.00 on the self.start date
         '''
-        partp = self.price[self.price['date'] <= date]
-        partm = self.bmprice[self.bmprice['date'] <= date]
+        partp = self.alignedprice[self.alignedprice['date'] <= date]
+        bmprice = self._bmprice(benchmark)
+        partm = bmprice[bmprice['date'] <= date]
         normp = partp.iloc[0].netvalue
         normm = partm.iloc[0].netvalue
         partp['netvalue'] = partp['netvalue'] / normp
@@ -84,8 +268,9 @@ class indicator():
         return (partp, partm)
 
     def total_return(self, date=yesterdayobj()):
-        return round((self.price[self.price['date'] <= date].iloc[-1].netvalue - self.price.iloc[0].netvalue)
-                     / self.price.iloc[0].netvalue, 4)
+        price = self.alignedprice
+        return round((price[price['date'] <= date].iloc[-1].netvalue - price.iloc[0].netvalue)
+                     / price.iloc[0].netvalue, 4)
 
     def annualized_returns(price, start, date=yesterdayobj()):
         '''
@@ -99,63 +284,90 @@ class indicator():
         return round((1 + totreturn) ** (365 / datediff) - 1, 4)
 
     def total_annualized_returns(self, date=yesterdayobj()):
-        return indicator.annualized_returns(self.price, self.start, date)
+        return indicator.annualized_returns(self.alignedprice, self.start, date)
 
-    def benchmark_annualized_returns(self, date=yesterdayobj()):
-        return indicator.annualized_returns(self.bmprice, self.start, date)
+    def benchmark_annualized_returns(self, date=yesterdayobj(), benchmark=None):
+        return indicator.annualized_returns(self._bmprice(benchmark), self.start, date)
 
-    def beta(self, date=yesterdayobj()):
-        bcmk = indicator.ratedaily(self.bmprice, date)
-        bt = indicator.ratedaily(self.price, date)
+    def beta(self, date=yesterdayobj(), benchmark=None):
+        bcmk = self._rates(self._bmprice(benchmark), date)
+        bt = self._rates(self.alignedprice, date)
         df = pd.DataFrame(data={'bcmk': bcmk, 'bt': bt})
         res = df.cov()
         return res.loc['bcmk', 'bt'] / res.loc['bcmk', 'bcmk']
 
-    def alpha(self, date=yesterdayobj()):
+    def alpha(self, date=yesterdayobj(), benchmark=None):
         rp = self.total_annualized_returns(date)
-        rm = self.benchmark_annualized_returns(date)
-        beta = self.beta(date)
+        rm = self.benchmark_annualized_returns(date, benchmark)
+        beta = self.beta(date, benchmark)
         return rp - (self.riskfree + beta * (rm - self.riskfree))
 
-    def correlation_coefficient(self, date=yesterdayobj()):
+    def correlation_coefficient(self, date=yesterdayobj(), benchmark=None):
         '''
         correlation coefficient between aim and benchmark values,
             可以很好地衡量指数基金的追踪效果
 
+        :param benchmark: key of the benchmark in bcmkset, default the first one
         :returns: float between -1 and 1
         '''
-        bcmk = indicator.ratedaily(self.bmprice, date)
-        bt = indicator.ratedaily(self.price, date)
+        bcmk = self._rates(self._bmprice(benchmark), date)
+        bt = self._rates(self.alignedprice, date)
         df = pd.DataFrame(data={'bcmk': bcmk, 'bt': bt})
         res = df.cov()
         return res.loc['bcmk', 'bt'] / ((res.loc['bcmk', 'bcmk'] ** 0.5) * res.loc['bt', 'bt'] ** 0.5)
 
     def ratedaily(price, date=yesterdayobj()):
-        partp = price[price['date'] <= date]
-        return [(partp.iloc[i + 1].netvalue - partp.iloc[i].netvalue) /
-                partp.iloc[i].netvalue for i in range(len(partp) - 1)]
+        netvalue = price[price['date'] <= date]['netvalue'].values
+        return ((netvalue[1:] - netvalue[:-1]) / netvalue[:-1]).tolist()
+
+    def _rates(self, price, date=yesterdayobj()):
+        '''
+        daily returns of the price table up to date. The returns of the whole table are computed once and
+        cached until the table is replaced, eg. by bcmkset, so that each cutoff date is only a slice of them.
+
+        :param price: the aligned price table, self.alignedprice or one of self.bmprices
+        :param date: date obj or string
+        :returns: np.array, the same as ratedaily(price, date)
+        '''
+        dates, rates = self._ratearrays(price)
+        k = np.searchsorted(dates, np.datetime64(convert_date(date), 'ns'), side='right')
+        return rates[:max(k - 1, 0)]
+
+    def _ratearrays(self, price):
+        '''
+        :returns: tuple of np.array, (dates of the price table in datetime64, daily returns of the table)
+        '''
+        cache = getattr(self, '_ratecache', None)
+        if cache is None:
+            cache = self._ratecache = {}
+        # the table is kept in the cache, so its id is not reused by other tables while cached
+        key = id(price)
+        if key not in cache or cache[key][0] is not price:
+            netvalue = price['netvalue'].values
+            cache[key] = (price, price['date'].values.astype('datetime64[ns]'),
+                          (netvalue[1:] - netvalue[:-1]) / netvalue[:-1])
+        return cache[key][1:]
 
     def volatility(price, date=yesterdayobj()):
         df = pd.DataFrame(data={'rate': indicator.ratedaily(price, date)})
         return df.std().rate * 15.8144
 
     def algorithm_volatility(self, date=yesterdayobj()):
-        return indicator.volatility(self.price, date)
+        return pd.DataFrame(data={'rate': self._rates(self.alignedprice, date)}).std().rate * 15.8144
 
-    def benchmark_volatility(self, date=yesterdayobj()):
-        return indicator.volatility(self.bmprice, date)
+    def benchmark_volatility(self, date=yesterdayobj(), benchmark=None):
+        return pd.DataFrame(data={'rate': self._rates(self._bmprice(benchmark), date)}).std().rate * 15.8144
 
     def sharpe(self, date=yesterdayobj()):
         rp = self.total_annualized_returns(date)
         return (rp - self.riskfree) / self.algorithm_volatility(date)
 
-    def information_ratio(self, date=yesterdayobj()):
+    def information_ratio(self, date=yesterdayobj(), benchmark=None):
         rp = self.total_annualized_returns(date)
-        rm = self.benchmark_annualized_returns(date)
-        vp = indicator.ratedaily(self.price, date)
-        vm = indicator.ratedaily(self.bmprice, date)
-        diff = [vp[i] - vm[i] for i in range(len(vm))]
-        df = pd.DataFrame(data={'rate': diff})
+        rm = self.benchmark_annualized_returns(date, benchmark)
+        vp = self._rates(self.alignedprice, date)
+        vm = self._rates(self._bmprice(benchmark), date)
+        df = pd.DataFrame(data={'rate': vp[:len(vm)] - vm})
         var = df.std().rate
         var = var * 15.8144
         return (rp - rm) / var
@@ -168,15 +380,298 @@ class indicator():
         :returns: three elements tuple, the first two are the date obj of
             start and end of the time window, the third one is the drawdown amplitude in unit 1.
         '''
-        li = [(row['date'], row['netvalue']) for i, row in self.price[self.price['date'] <= date].iterrows()]
-        res = []
-        for i, _ in enumerate(li):
-            for j in range(i + 1, len(li)):
-                res.append((li[i][0], li[j][0], (li[j][1] - li[i][1]) / li[i][1]))
-        return min(res, key=lambda x: x[2])
+        partp = self.alignedprice[self.alignedprice['date'] <= date]
+        netvalue, dates = partp['netvalue'].values, partp['date']
+        if len(netvalue) < 2:
+            raise ValueError('max_drawdown needs at least two netvalues')
+        peak, peakidx = indicator._runningpeak(netvalue)
+        # for each end j, the best start is the first running peak before j, ties are broken the same as
+        # taking the min over all pairs (i, j) enumerated in order
+        rates = (netvalue[1:] - peak[:-1]) / peak[:-1]
+        ends = np.nonzero(rates == rates.min())[0]
+        k = ends[np.lexsort((ends, peakidx[ends]))[0]]
+        return (dates.iloc[peakidx[k]], dates.iloc[k + 1], rates[k])
+
+    def _runningpeak(netvalue):
+        '''
+        :param netvalue: np.array of netvalues
+        :returns: tuple of np.array, (the running max, index of its first occurrence)
+        '''
+        peak = np.maximum.accumulate(netvalue)
+        newpeak = np.concatenate([[True], netvalue[1:] > peak[:-1]])
+        peakidx = np.maximum.accumulate(np.where(newpeak, np.arange(len(netvalue)), 0))
+        return peak, peakidx
+
+    def drawdown_series(self, date=yesterdayobj()):
+        '''
+        回撤曲线，每日净值相对此前最高点的回撤
+
+        :param date: date obj or string
+        :returns: pd.DataFrame with date and drawdown columns, drawdown is non-positive in unit 1
+        '''
+        partp = self.alignedprice[self.alignedprice['date'] <= date]
+        netvalue = partp['netvalue'].values
+        peak, _ = indicator._runningpeak(netvalue)
+        return pd.DataFrame(data={'date': partp['date'].values, 'drawdown': (netvalue - peak) / peak})
+
+    def top_drawdowns(self, k=5, date=yesterdayobj()):
+        '''
+        回测时间段内幅度最大的 k 次回撤，各次回撤互不重叠，每次从前高开始，到重新回到前高结束
+
+        :param k: int, the number of drawdowns
+        :param date: date obj or string
+        :returns: pd.DataFrame with columns start, end, recovery and drawdown, sorted by drawdown,
+            start and end are dates of the peak and the trough, recovery is the first date back to the peak,
+            NaT if not recovered yet, drawdown is the amplitude in unit 1 as in max_drawdown
+        '''
+        partp = self.alignedprice[self.alignedprice['date'] <= date]
+        netvalue = partp['netvalue'].values
+        dates = partp['date'].values
+        peak, peakidx = indicator._runningpeak(netvalue)
+        dd = (netvalue - peak) / peak
+        under = dd < 0
+        edges = np.diff(np.concatenate([[False], under, [False]]).astype(int))
+        starts, stops = np.nonzero(edges == 1)[0], np.nonzero(edges == -1)[0]
+        troughs = np.array([a + np.argmin(dd[a:b]) for a, b in zip(starts, stops)], dtype=int)
+        episodes = pd.DataFrame(data={
+            'start': dates[peakidx[starts]], 'end': dates[troughs],
+            'recovery': [dates[b] if b < len(dates) else np.datetime64('NaT') for b in stops],
+            'drawdown': dd[troughs]}, columns=['start', 'end', 'recovery', 'drawdown'])
+        return episodes.sort_values(by='drawdown', kind='mergesort').iloc[:k].reset_index(drop=True)
+
+    _reportmetrics = ['total_return', 'total_annualized_returns', 'benchmark_annualized_returns', 'beta', 'alpha',
+                      'correlation_coefficient', 'algorithm_volatility', 'benchmark_volatility', 'sharpe',
+                      'information_ratio', 'max_drawdown']
+
+    def metrics_report(self, dates, metrics=None, benchmark=None):
+        '''
+        give the metrics on many cutoff dates in one pass, from the cumulative sums of daily returns, their squares
+        and cross products, together with the running peak of netvalues. The results equal those of calling the
+        metric functions on each date, except for rounding errors in the last few digits of the moments,
+        which are not summed in the same order as pandas does.
+
+        :param dates: list of date obj or string, the cutoff dates
+        :param metrics: list of string, names of the metric functions, default all of the following:
+            total_return, total_annualized_returns, benchmark_annualized_returns, beta, alpha,
+            correlation_coefficient, algorithm_volatility, benchmark_volatility, sharpe, information_ratio and
+            max_drawdown, where only the amplitude of max_drawdown is given
+        :param benchmark: key of the benchmark in bcmkset, default the first one
+        :returns: pd.DataFrame with date column and one column for each metric,
+            the metrics are nan on dates without enough netvalues
+        '''
+        if metrics is None:
+            metrics = indicator._reportmetrics
+        unknown = [m for m in metrics if m not in indicator._reportmetrics]
+        if unknown:
+            raise Exception('metrics not supported in metrics_report: %s' % unknown)
+        dates = pd.DatetimeIndex([convert_date(date) for date in dates])
+        price = self.alignedprice
+        pricedates, rp = self._ratearrays(price)
+        ks = np.searchsorted(pricedates, dates.values, side='right')  # number of netvalues up to each date
+        n = np.maximum(ks - 1, 0)  # number of daily returns up to each date
+        needbm = set(metrics) - {'total_return', 'total_annualized_returns', 'algorithm_volatility', 'sharpe',
+                                 'max_drawdown'}
+        bmprice = self._bmprice(benchmark) if needbm else None
+        rm = self._ratearrays(bmprice)[1] if needbm else None
+        cols = {}
+        with np.errstate(all='ignore'):
+            cols['total_return'] = indicator._prefixreturns(price, ks, self.start, annualized=False)
+            cols['total_annualized_returns'] = indicator._prefixreturns(price, ks, self.start)
+            varp = indicator._prefixcov(rp, rp, n)
+            cols['algorithm_volatility'] = varp ** 0.5 * 15.8144
+            cols['sharpe'] = (cols['total_annualized_returns'] - self.riskfree) / cols['algorithm_volatility']
+            if needbm:
+                cols['benchmark_annualized_returns'] = indicator._prefixreturns(bmprice, ks, self.start)
+                varm = indicator._prefixcov(rm, rm, n)
+                cov = indicator._prefixcov(rm, rp, n)
+                cols['benchmark_volatility'] = varm ** 0.5 * 15.8144
+                cols['beta'] = cov / varm
+                cols['alpha'] = cols['total_annualized_returns'] - (
+                    self.riskfree + cols['beta'] * (cols['benchmark_annualized_returns'] - self.riskfree))
+                cols['correlation_coefficient'] = cov / (varm ** 0.5 * varp ** 0.5)
+                vard = indicator._prefixcov(rp - rm, rp - rm, n)
+                cols['information_ratio'] = (cols['total_annualized_returns'] - cols['benchmark_annualized_returns']) \
+                                            / (vard ** 0.5 * 15.8144)
+            if 'max_drawdown' in metrics:
+                netvalue = price['netvalue'].values
+                peak, _ = indicator._runningpeak(netvalue)
+                worst = np.minimum.accumulate((netvalue[1:] - peak[:-1]) / peak[:-1])
+                cols['max_drawdown'] = np.where(n > 0, worst[np.maximum(n - 1, 0)] if len(worst) > 0 else np.nan,
+                                                np.nan)
+        report = pd.DataFrame(data={'date': dates})
+        for m in metrics:
+            report[m] = cols[m]
+        return report
+
+    def _prefixreturns(price, ks, start, annualized=True):
+        '''
+        total returns, or annualized returns as annualized_returns, of the first ks rows of price table
+        '''
+        netvalue = price['netvalue'].values
+        days = (price['date'] - start).dt.days.values
+        res = np.full(len(ks), np.nan)
+        for j, k in enumerate(ks):  # scalar operations as the metric functions, so that the rounding is the same
+            if k == 0:
+                continue
+            totreturn = (netvalue[k - 1] - netvalue[0]) / netvalue[0]
+            if not annualized:
+                res[j] = round(totreturn, 4)
+            elif days[k - 1] != 0:
+                res[j] = round((1 + totreturn) ** (365 / days[k - 1]) - 1, 4)
+        return res
+
+    def _prefixcov(x, y, n):
+        '''
+        sample covariances of the first n elements of x and y for each n, from cumulative sums,
+        the arrays are shifted by their means beforehand to avoid cancellation
+
+        :returns: np.array, nan for n < 2
+        '''
+        if len(x) == 0:
+            return np.full(len(n), np.nan)
+        x = x - x.mean()
+        y = y - y.mean()
+        sx = np.concatenate([[0.], np.cumsum(x)])[n]
+        sy = np.concatenate([[0.], np.cumsum(y)])[n]
+        sxy = np.concatenate([[0.], np.cumsum(x * y)])[n]
+        return np.where(n > 1, (sxy - sx * sy / n) / (n - 1), np.nan)
+
+    _rollingmetrics = ['volatility', 'beta', 'sharpe', 'tracking_error', 'information_ratio']
+
+    def rolling_metrics(self, window=250, metrics=None, benchmark=None):
+        '''
+        rolling risk metrics on the latest window daily returns of each day, from the rolling moments of the aligned
+        daily returns of the aim and the benchmark. The annualized returns in sharpe and information ratio are from
+        the total return of the window and the calendar days it spans, without rounding.
+
+        :param window: int, the number of daily returns in each window, eg. 60, 120 or 250
+        :param metrics: list of string, default all of the following: volatility, beta, sharpe, tracking_error
+            and information_ratio, the volatility and tracking error are annualized as algorithm_volatility
+        :param benchmark: key of the benchmark in bcmkset, default the first one
+        :returns: pd.DataFrame with date column of the aligned price table and one column for each metric,
+            the metrics are nan on days without a full window
+        '''
+        if metrics is None:
+            metrics = indicator._rollingmetrics
+        unknown = [m for m in metrics if m not in indicator._rollingmetrics]
+        if unknown:
+            raise Exception('metrics not supported in rolling_metrics: %s' % unknown)
+        price = self.alignedprice
+        dates = price['date']
+        # the daily return of each day, nan on the first day
+        rp = pd.Series(np.concatenate([[np.nan], self._ratearrays(price)[1]]))
+        span = (dates - dates.shift(window)).dt.days.values
+        cols = {}
+        with np.errstate(all='ignore'):
+            netvalue = price['netvalue'].values
+            annualp = (netvalue / price['netvalue'].shift(window).values) ** (365 / span) - 1
+            cols['volatility'] = rp.rolling(window).std().values * 15.8144
+            cols['sharpe'] = (annualp - self.riskfree) / cols['volatility']
+            if set(metrics) - {'volatility', 'sharpe'}:
+                bmprice = self._bmprice(benchmark)
+                rm = pd.Series(np.concatenate([[np.nan], self._ratearrays(bmprice)[1]]))
+                bmvalue = bmprice['netvalue'].values
+                annualm = (bmvalue / bmprice['netvalue'].shift(window).values) ** (365 / span) - 1
+                cols['beta'] = (rp.rolling(window).cov(rm) / rm.rolling(window).var()).values
+                cols['tracking_error'] = (rp - rm).rolling(window).std().values * 15.8144
+                cols['information_ratio'] = (annualp - annualm) / cols['tracking_error']
+        report = pd.DataFrame(data={'date': dates.values})
+        for m in metrics:
+            report[m] = cols[m]
+        return report
 
     ## 以上基本为聚宽提供的整体量化指标，以下是其他短线技术面指标
 
+    def feature(self, name, **params):
+        '''
+        lazy and memoized technical indicator columns. Instead of writing new columns into the price table,
+        the columns given by the indicator function are computed on the first access and kept in a side store keyed by
+        the name and parameters, the store is cleared once the price table grows, eg. by update.
+
+        :param name: string, name of the technical indicator function, eg. 'ma', 'macd' or 'psy'
+        :param params: keyword arguments of the function, col may also be a column of other features in the store
+        :returns: pd.DataFrame of the new columns given by the function, with the same index as the price table
+        '''
+        price = self.price
+        stamp = (len(price), price['date'].iloc[-1] if len(price) > 0 else None)
+        store = getattr(self, '_featurestore', None)
+        if store is None or store[0] != stamp:
+            store = self._featurestore = (stamp, {})
+        key = (name, tuple(sorted(params.items())))
+        if key not in store[1]:
+            col = params.get('col', 'netvalue')
+            scratch = price.loc[:, ['date', 'netvalue']]
+            if col not in scratch.columns:
+                if col in price.columns:
+                    scratch[col] = price[col]
+                else:
+                    scratch[col] = [frame for frame in store[1].values() if col in frame.columns][0][col]
+            base = list(scratch.columns)
+            # the indicator functions write into self.price, so they are run on the scratch table instead
+            self.price = scratch
+            try:
+                getattr(self, name)(**params)
+                store[1][key] = scratch.drop(base, axis=1)
+            finally:
+                self.price = price
+        return store[1][key]
+
+    def stream(self, name, **params):
+        '''
+        streaming version of technical indicators. The columns are written into the price table as the indicator
+        function does, while the recursive states of the indicator are kept in the object, so that the columns are
+        advanced incrementally for the new days appended by update instead of the full recomputation.
+
+        :param name: string, one of 'ema', 'macd', 'rsi', 'boll' and 'kdj'
+        :param params: keyword arguments of the indicator function
+        :returns: the stream object, whose peek method gives the values of hypothetical new days
+        '''
+        if name not in _streamclass:
+            raise Exception('no streaming version for indicator: %s' % name)
+        streams = getattr(self, '_streams', None)
+        if streams is None:
+            streams = self._streams = {}
+        key = (name, tuple(sorted(params.items())))
+        if key not in streams:
+            streams[key] = [_streamclass[name](**params), 0]
+            self._advancestreams()
+        return streams[key][0]
+
+    def _advancestreams(self):
+        '''
+        feed the rows of price table which are new to the registered streams and fill their columns
+        '''
+        n = len(self.price)
+        for entry in getattr(self, '_streams', {}).values():
+            st, start = entry
+            if start >= n:
+                continue
+            values = st.update(self.price[st.col].values[start:])
+            for i, c in enumerate(st.columns):
+                if c in self.price.columns:
+                    column = self.price[c].values.astype(float)
+                else:
+                    column = np.full(n, np.nan)
+                column[start:] = values[:, i]
+                self.price[c] = column
+            entry[1] = n
+
+    def peekstreams(self, values):
+        '''
+        values of all the registered streams for hypothetical new days of netvalue, the states are left untouched,
+        eg. for the realtime estimate of netvalue within the trading day
+
+        :param values: list of netvalues of the following days
+        :returns: pd.DataFrame with one row for each value and the columns of all streams
+        '''
+        peeked = {'netvalue': np.asarray(values, dtype=float)}
+        for st, _ in getattr(self, '_streams', {}).values():
+            # streams on columns other than netvalue and the peeked ones are unknown for new days
+            col = peeked.get(st.col, np.full(len(values), np.nan))
+            for c, v in zip(st.columns, st.peek(col).T):
+                peeked[c] = v
+        return pd.DataFrame(data=peeked)
+
     def ma(self, window=5, col='netvalue'):
         '''
         移动平均线指标
@@ -217,14 +712,14 @@ class indicator():
         :param signal_window: int, the ema window of the signal line
         :param col: string, column name in dataframe you want to calculate
         '''
-        EMAfast = pd.Series(self.price[col].ewm(span=fast_window).mean())
-        EMAslow = pd.Series(self.price[col].ewm(span=slow_window).mean())
+        EMAfast = self.price[col].ewm(span=fast_window).mean()
+        EMAslow = self.price[col].ewm(span=slow_window).mean()
         # 短期ema和长期ema的差
-        MACDDiff = pd.Series(EMAfast - EMAslow)
+        MACDDiff = EMAfast - EMAslow
         # 该差的再次 ema 平均
-        MACDDem = pd.Series(MACDDiff.ewm(span=signal_window).mean())
+        MACDDem = MACDDiff.ewm(span=signal_window).mean()
         # ema平均过的差和原来差的差
-        MACDOsc = pd.Series(MACDDiff - MACDDem)
+        MACDOsc = MACDDiff - MACDDem
         self.price['MACD_DIFF_' + str(fast_window) + '_' + str(slow_window)] = MACDDiff
         self.price['MACD_DEM_' + str(fast_window) + '_' + str(slow_window)] = MACDDem
         self.price['MACD_OSC_' + str(fast_window) + '_' + str(slow_window)] = MACDOsc
@@ -249,7 +744,7 @@ class indicator():
         '''
         abdiff = self.price[col].diff(window)
         deno = self.price[col].shift(window)
-        reladiff = pd.Series(abdiff / deno)
+        reladiff = abdiff / deno
         self.price['ROC' + str(window)] = reladiff
 
     def boll(self, window=10, deviation=2, col='netvalue'):
@@ -286,26 +781,13 @@ class indicator():
         :param window: int, MA_window
         :param col: string, column name in dataframe you want to calculate
         '''
-        i = 0
-        UpI = [0]
-        DoI = [0]
-        while i + 1 <= len(self.price) - 1:
-            Move = self.price.loc[i + 1, col] - self.price.loc[i, col]
-            if Move > 0:
-                UpD = Move
-                DoD = 0
-            else:
-                UpD = 0
-                DoD = -Move
-            UpI.append(UpD)
-            DoI.append(DoD)
-            i = i + 1
-
-        UpI = pd.Series(UpI)
-        DoI = pd.Series(DoI)
-        PosDI = pd.Series(UpI.ewm(span=window).mean())
-        NegDI = pd.Series(DoI.ewm(span=window).mean())
-        self.price['RSI' + str(window)] = pd.Series(PosDI / (PosDI + NegDI))
+        move = self.price[col].diff()
+        UpI = move.where(move > 0, 0)
+        DoI = (-move).mask(move > 0, 0)
+        DoI.iloc[0] = 0
+        PosDI = UpI.ewm(span=window).mean()
+        NegDI = DoI.ewm(span=window).mean()
+        self.price['RSI' + str(window)] = PosDI / (PosDI + NegDI)
 
     def kdj(self, rsv_window=9, k_window=3, d_window=3, col='netvalue'):
         '''
@@ -393,7 +875,10 @@ class indicator():
         :param ma_window: int
         :param col: string, column name in dataframe you want to calculate
         '''
-        psy = self.price[col].rolling(count_window + 1).aggregate(_upcount)
+        price = self.price[col]
+        # whether each day moves up, nan if either of the two days is nan, so that windows with nan are still nan
+        up = (price > price.shift(1)).astype('float64').where(price.notna() & price.shift(1).notna())
+        psy = up.rolling(count_window).sum() / count_window
         psyma = psy.rolling(ma_window).mean()
         self.price['PSY' + str(count_window)] = psy
         self.price['PSYMA' + str(count_window)] = psyma
@@ -436,3 +921,73 @@ class indicator():
                 inddata = [[row['date'], row[ind]] for _, row in partprice.iterrows()]
                 line.add(ind, xdata, inddata, is_datazoom_show=True, xaxis_type="time", **vkwds)
         return line
+
+
+def _panelunsupported(name):
+    '''
+    the method of :class:`indicator` which makes no sense on the matrices of :class:`panel`
+    '''
+
+    def method(self, *args, **kws):
+        raise NotImplementedError('%s is not supported by panel, use the info or mulfix obj of each fund instead' % name)
+
+    method.__name__ = name
+    return method
+
+
+class panel(indicator):
+    '''
+    cross-sectional technical indicators over a panel of funds. The price table is a dict of date × fund matrices
+    instead of a DataFrame with columns, and the technical indicator functions of :class:`indicator` compute each
+    indicator for all funds at once with 2-D operations, eg. ``p.ma(20)`` gives the matrix ``p['MA20']`` whose
+    columns agree with the MA20 column of each fund. 只支持短线技术指标，不支持需要 bcmkset 的整体量化指标和可视化。
+
+    :param totprice: pd.DataFrame of aligned netvalues with a date column and one column for each fund,
+        eg. :attr:`xalpha.evaluate.evaluate.totprice`, or with the date as index
+    '''
+    # the overall metrics, the lazy features, the streams and the visualization work on one fund only
+    bcmkset = _panelunsupported('bcmkset')
+    comparison = _panelunsupported('comparison')
+    total_return = _panelunsupported('total_return')
+    total_annualized_returns = _panelunsupported('total_annualized_returns')
+    benchmark_annualized_returns = _panelunsupported('benchmark_annualized_returns')
+    beta = _panelunsupported('beta')
+    alpha = _panelunsupported('alpha')
+    correlation_coefficient = _panelunsupported('correlation_coefficient')
+    algorithm_volatility = _panelunsupported('algorithm_volatility')
+    benchmark_volatility = _panelunsupported('benchmark_volatility')
+    sharpe = _panelunsupported('sharpe')
+    information_ratio = _panelunsupported('information_ratio')
+    max_drawdown = _panelunsupported('max_drawdown')
+    drawdown_series = _panelunsupported('drawdown_series')
+    top_drawdowns = _panelunsupported('top_drawdowns')
+    metrics_report = _panelunsupported('metrics_report')
+    rolling_metrics = _panelunsupported('rolling_metrics')
+    feature = _panelunsupported('feature')
+    stream = _panelunsupported('stream')
+    peekstreams = _panelunsupported('peekstreams')
+    v_netvalue = _panelunsupported('v_netvalue')
+    v_techindex = _panelunsupported('v_techindex')
+
+    def __init__(self, totprice):
+        if 'date' in totprice.columns:
+            totprice = totprice.set_index('date')
+        self.price = {'netvalue': totprice.astype('float64')}
+
+    def __getitem__(self, col):
+        return self.price[col]
+
+    def cross(self, fast, slow):
+        '''
+        交叉信号矩阵，交叉的判定和 :class:`xalpha.policy.indicator_cross` 一致。
+        screening of the universe is then one array operation, eg. the funds whose MA20 crossed above MA60
+        on the last day are ``p.cross('MA20', 'MA60').iloc[-1] == 1``
+
+        :param fast: string, name of the matrix which crosses, eg. 'MA20' or 'netvalue'
+        :param slow: string, name of the matrix crossed, eg. 'MA60'
+        :returns: pd.DataFrame of the same shape, 1 when fast crosses slow from below on the day,
+            -1 when from above and 0 otherwise
+        '''
+        diff = self.price[fast] - self.price[slow]
+        prev = diff.shift(1)
+        return ((diff > 0) & (prev <= 0)).astype(int) - ((diff < 0) & (prev >= 0)).astype(int)
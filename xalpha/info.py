@@ -3,18 +3,24 @@
 modules of info class, including cashinfo, indexinfo and fundinfo class
 '''
 import re
+import io
+import time
+import threading
+import weakref
+from collections import OrderedDict
 import datetime as dt
+import numpy as np
 import pandas as pd
 import json
 from sqlalchemy import exc
 from slimit import ast
 from slimit.parser import Parser
 from slimit.visitors import nodevisitor
-import csv
 import requests as rq
 from bs4 import BeautifulSoup
 
-from xalpha.cons import myround, convert_date, opendate, droplist, yesterday, yesterdaydash, yesterdayobj
+from xalpha.cons import myround, tocents, fromcents, convert_date, opendate, droplist, yesterday, yesterdaydash, \
+    yesterdayobj
 import xalpha.remain as rm
 from xalpha.indicator import indicator
 
@@ -39,6 +45,27 @@ def _download(url, tries=3):
     return page
 
 
+def _jsvars(tree, *names):
+    '''
+    collect the values of given var statements in one pass over the js syntax tree,
+    the traverse stops as soon as all names are found
+
+    :param tree: slimit ast tree of the js page
+    :param names: strings, var names in the js page, eg. 'fS_name'
+    :returns: dict with var name as keys and the right hand side ast node as values
+    '''
+    res = {}
+    for node in nodevisitor.visit(tree):
+        if isinstance(node, ast.VarStatement):
+            decl = node.children()[0]
+            name = decl.children()[0].value
+            if name in names and name not in res:
+                res[name] = decl.children()[1]
+                if len(res) == len(names):
+                    break
+    return res
+
+
 def _shengoucal(sg, sgf, value, label):
     '''
     Infer the share of buying fund by money input, the rate of fee in the unit of %,
@@ -55,6 +82,36 @@ def _shengoucal(sg, sgf, value, label):
     return (jsg, share)
 
 
+def _readindexcsv(url):
+    '''
+    download and parse the daily close price csv from 163 api, the csv is in descending order of date
+    with columns 日期, 股票代码, 名称, 收盘价
+
+    :param url: string of the csv url
+    :returns: tuple of the name string of the index or stock and pd.DataFrame with date and totvalue columns
+        in ascending order of date, the name is None if there is no rows in the csv
+    '''
+    raw = _download(url)
+    df = pd.read_csv(io.BytesIO(raw.content), encoding='gbk', usecols=[0, 2, 3])
+    df.columns = ['date', 'name', 'totvalue']
+    name = df['name'].iloc[0] if len(df) > 0 else None
+    df = pd.DataFrame({'date': pd.to_datetime(df['date'], format='%Y-%m-%d'),
+                       'totvalue': pd.to_numeric(df['totvalue']).astype('float64')}).iloc[::-1]
+    return name, df.reset_index(drop=True)
+
+
+def _mfnetvalue(startvalue, earnrate):
+    '''
+    reconstruct the netvalue of monetary fund from daily earning rates by cumulative product,
+    the result is the same as multiplying day by day starting from startvalue
+
+    :param startvalue: float, the netvalue before the first earning rate
+    :param earnrate: np.array of daily earning rates in the unit of 1, i.e. 万份收益*1e-4
+    :returns: np.array of netvalues, with the same length as earnrate
+    '''
+    return np.cumprod(np.concatenate([[startvalue], 1 + earnrate]))[1:]
+
+
 def _nfloat(string):
     '''
     deal with comment column in fundinfo price table,
@@ -160,18 +217,26 @@ class basicinfo(indicator):
             the third is a negative float for share decrease
         '''
         date = convert_date(date)
-        tots = sum([remitem[1] for remitem in rem if remitem[0] <= date])
-        if share > tots:
-            sh = tots
-        else:
-            sh = share
         partprice = self.price[self.price['date'] >= date]
         if len(partprice) == 0:
             row = self.price[self.price['date'] < date].iloc[-1]
         else:
             row = partprice.iloc[0]
-        value = myround(sh * row.netvalue)
-        return (row.date, value, -myround(sh))
+        return self._shuhuivalue(share, date, row.date, row.netvalue, rem)
+
+    def _shuhuivalue(self, share, date, tradedate, netvalue, rem):
+        '''
+        the redemption given the trade date and netvalue on that date, which are found by shuhui
+
+        :returns: the same as shuhui
+        '''
+        tots = sum([remitem[1] for remitem in rem if remitem[0] <= date])
+        if share > tots:
+            sh = tots
+        else:
+            sh = share
+        value = myround(sh * netvalue)
+        return (tradedate, value, -myround(sh))
 
     def info(self):
         '''
@@ -260,7 +325,12 @@ class fundinfo(basicinfo):
         self._feeurl = 'http://fund.eastmoney.com/f10/jjfl_' + code + '.html'  # html url for trade fees info of certain fund
 
         super().__init__(code, fetch=fetch, save=save, path=path, form=form, label=self.label)
+        self._specialprocess()
 
+    def _specialprocess(self):
+        '''
+        set self.special and the lists of special dates based on the comment column of price table
+        '''
         self.special = self.price[self.price['comment'] != 0]
         self.specialdate = list(self.special['date'])
         # date with nonvanishing comment, usually fenhong or zhesuan
@@ -274,12 +344,9 @@ class fundinfo(basicinfo):
         self._page = _download(self._url)
         parser = Parser()  # parse the js text of API page using slimit module
         tree = parser.parse(self._page.text)
-        nodenet = [node.children()[0].children()[1] for node in nodevisitor.visit(tree)
-                   if isinstance(node, ast.VarStatement) and node.children()[0].children()[
-                       0].value == 'Data_netWorthTrend'][0]
-        nodetot = [node.children()[0].children()[1] for node in nodevisitor.visit(tree)
-                   if isinstance(node, ast.VarStatement) and node.children()[0].children()[
-                       0].value == 'Data_ACWorthTrend'][0]
+        jsvars = _jsvars(tree, 'Data_netWorthTrend', 'Data_ACWorthTrend', 'fund_Rate', 'fS_name')
+        nodenet = jsvars['Data_netWorthTrend']
+        nodetot = jsvars['Data_ACWorthTrend']
         ## timestamp transform tzinfo must be taken into consideration
         tz_bj = dt.timezone(dt.timedelta(hours=8))
 
@@ -296,11 +363,8 @@ class fundinfo(basicinfo):
             infodict["totvalue"] = [float(nodetot.children()[i].children()[1].value) for i in
                                     range(len(nodenet.children()))]
 
-        rate = [node.children()[0].children()[1] for node in nodevisitor.visit(tree)
-                if isinstance(node, ast.VarStatement) and (node.children()[0].children()[0].value == 'fund_Rate')][0]
-
-        name = [node.children()[0].children()[1] for node in nodevisitor.visit(tree)
-                if isinstance(node, ast.VarStatement) and (node.children()[0].children()[0].value == 'fS_name')][0]
+        rate = jsvars['fund_Rate']
+        name = jsvars['fS_name']
 
         self.rate = float(
             rate.value.strip('"'))  # shengou rate in tiantianjijin, daeshengou rate discount is not considered
@@ -354,6 +418,48 @@ class fundinfo(basicinfo):
 
         return b
 
+    def _feeschedule(self):
+        '''
+        compile self.segment and self.feeinfo into breakpoint and rate arrays, the result is cached until
+        segment or feeinfo is changed (they can be adjusted by hand when the fee page is weird)
+
+        :returns: tuple of np.array, (breakpoints, rates) of the piecewise constant fee function, where the fee
+            for day in [breakpoints[i-1], breakpoints[i]) is rates[i]; breakpoints is None if the segments are not
+            ordered, then rates is the fee for each segment instead, and the first matching segment wins
+        '''
+        key = (tuple(tuple(seg) for seg in self.segment), tuple(self.feeinfo))
+        if getattr(self, '_feecache', (None,))[0] == key:
+            return self._feecache[1]
+        segrates = [float(self.feeinfo[2 * i + 1].strip("%")) for i in range(len(self.segment))]
+        points = []
+        rates = [0.]  # no fee before the first segment or between segments, just as feedecision backup
+        for seg, rate in zip(self.segment, segrates):
+            points.append(seg[0])
+            rates.append(rate)
+            if len(seg) > 1:
+                points.append(seg[-1])
+                rates.append(0.)
+        if all(points[i] <= points[i + 1] for i in range(len(points) - 1)):
+            schedule = (np.array(points), np.array(rates))
+        else:
+            schedule = (None, np.array(segrates))
+        self._feecache = (key, schedule)
+        return schedule
+
+    def fee_rates(self, days):
+        '''
+        vectorized version of feedecision on the holding days of lots
+
+        :param days: array-like of integers, 赎回与申购时间之差的自然日数
+        :returns: np.array of float，赎回费率，以％为单位
+        '''
+        days = np.asarray(days)
+        points, rates = self._feeschedule()
+        if points is not None:
+            return rates[np.searchsorted(points, days, side='right')]
+        conds = [(days >= seg[0]) & ((len(seg) == 1) | (days < seg[-1])) for seg in self.segment]
+        return np.select(conds, rates, default=0.)
+
     def feedecision(self, day):
         '''
         give the redemption rate in percent unit based on the days difference between purchase and redemption
@@ -361,12 +467,7 @@ class fundinfo(basicinfo):
         :param day: integer， 赎回与申购时间之差的自然日数
         :returns: float，赎回费率，以％为单位
         '''
-        i = -1
-        for seg in self.segment:
-            i += 2
-            if day - seg[0] >= 0 and (len(seg) == 1 or day - seg[-1] < 0):
-                return float(self.feeinfo[i].strip("%"))
-        return 0  # error backup, in case there is sth wrong in segment
+        return float(self.fee_rates([day])[0])
 
     def shuhui(self, share, date, rem):
         '''
@@ -377,18 +478,18 @@ class fundinfo(basicinfo):
             the third is a negative float for share decrease
         '''
         #		 value = myround(share*self.price[self.price['date']==date].iloc[0].netvalue)
-        date = convert_date(date)
-        partprice = self.price[self.price['date'] >= date]
-        if len(partprice) == 0:
-            row = self.price[self.price['date'] < date].iloc[-1]
-        else:
-            row = partprice.iloc[0]
-        soldrem, _ = rm.sell(rem, share, row.date)
+        return super().shuhui(share, date, rem)
+
+    def _shuhuivalue(self, share, date, tradedate, netvalue, rem):
+        soldrem, _ = rm.sell(rem, share, tradedate)
         value = 0
         sh = myround(sum([item[1] for item in soldrem]))
-        for d, s in soldrem:
-            value += myround(s * row.netvalue * (1 - self.feedecision((row.date - d).days) * 1e-2))
-        return (row.date, value, -sh)
+        if soldrem:
+            shares = np.array([item[1] for item in soldrem])
+            days = [(tradedate - item[0]).days for item in soldrem]
+            lotvalues = fromcents(tocents(shares * netvalue * (1 - self.fee_rates(days) * 1e-2)))
+            value = float(np.cumsum(lotvalues)[-1])  # accumulated lot by lot as before
+        return (tradedate, value, -sh)
 
     def info(self):
         super().info()
@@ -493,6 +594,9 @@ class fundinfo(basicinfo):
         df = df[df['date'] <= yesterdayobj()]
         if len(df) != 0:
             self.price = self.price.append(df, ignore_index=True, sort=True)
+            self._advancestreams()
+            if getattr(self, 'special', None) is not None:  # not the update within the init
+                self._specialprocess()
             return df
 
 
@@ -512,26 +616,30 @@ class indexinfo(basicinfo):
     '''
 
     def __init__(self, code, fetch=False, save=False, path='', form='csv'):
-        date = yesterday()
         self.rate = 0
-        self._url = 'http://quotes.money.163.com/service/chddata.html?code=' + code + '&start=19901219&end=' + date + '&fields=TCLOSE'
+        self._url = self._csvurl(code, '19901219')
         super().__init__(code, fetch=fetch, save=save, path=path, form=form)
 
+    def _csvurl(self, code, start):
+        return 'http://quotes.money.163.com/service/chddata.html?code=' + code + '&start=' + start + \
+               '&end=' + yesterday() + '&fields=TCLOSE'
+
+    def _pricetable(self, df, factor):
+        '''
+        normalize the raw close price into the price table of the class
+
+        :param df: pd.DataFrame with date and totvalue columns, from :func:`_readindexcsv`
+        :param factor: float, the index value corresponding to netvalue 1
+        :returns: price table with date, netvalue, totvalue and comment columns
+        '''
+        df = df[df['date'].isin(opendate) & (df['date'] <= yesterdayobj())]
+        return pd.DataFrame({'date': df['date'], 'netvalue': df['totvalue'] / factor, 'totvalue': df['totvalue'],
+                             'comment': 0}).reset_index(drop=True)
+
     def _basic_init(self):
-        raw = _download(self._url)
-        cr = csv.reader(raw.text.splitlines(), delimiter=',')
-        my_list = list(cr)
-        factor = float(my_list[-1][3])
-        dd = {'date': [dt.datetime.strptime(my_list[i + 1][0], '%Y-%m-%d') for i in range(len(my_list) - 1)],
-              'netvalue': [float(my_list[i + 1][3]) / factor for i in range(len(my_list) - 1)],
-              'totvalue': [float(my_list[i + 1][3]) for i in range(len(my_list) - 1)],
-              'comment': [0 for _ in range(len(my_list) - 1)]}
-        index = pd.DataFrame(data=dd)
-        index = index.iloc[::-1]
-        index = index.reset_index(drop=True)
-        self.price = index[index['date'].isin(opendate)]
-        self.price = self.price[self.price['date'] <= yesterdaydash()]
-        self.name = my_list[-1][2]
+        name, df = _readindexcsv(self._url)
+        self.price = self._pricetable(df, df['totvalue'].iloc[0])
+        self.name = name
 
     def _save_csv(self, path):
         '''
@@ -585,23 +693,16 @@ class indexinfo(basicinfo):
 
     def update(self):
         lastdate = self.price.iloc[-1].date
-        lastdatestr = lastdate.strftime('%Y%m%d')
-        weight = self.price.iloc[1].totvalue
-        self._updateurl = 'http://quotes.money.163.com/service/chddata.html?code=' + \
-                          self.code + '&start=' + lastdatestr + '&end=' + yesterday() + '&fields=TCLOSE'
-        df = pd.read_csv(self._updateurl, encoding='gb2312')
-        self.name = df.iloc[0].loc['名称']
-        if len(df) > 1:
-            df = df.rename(columns={'收盘价': 'totvalue'})
-            df['date'] = pd.to_datetime(df.日期)
-            df = df.drop(['股票代码', '名称', '日期'], axis=1)
-            df['netvalue'] = df.totvalue / weight
-            df['comment'] = [0 for _ in range(len(df))]
-            df = df.iloc[::-1].iloc[1:]
-            df = df[df['date'].isin(opendate)]
-            df = df.reset_index(drop=True)
-            df = df[df['date'] <= yesterdayobj()]
+        # keep the same normalization as the stored netvalue, which is 1 on the first day
+        weight = self.price.iloc[0].totvalue / self.price.iloc[0].netvalue
+        self._updateurl = self._csvurl(self.code, lastdate.strftime('%Y%m%d'))
+        name, df = _readindexcsv(self._updateurl)
+        if name is not None:
+            self.name = name
+        df = self._pricetable(df[df['date'] > lastdate], weight)
+        if len(df) > 0:
             self.price = self.price.append(df, ignore_index=True, sort=True)
+            self._advancestreams()
             return df
 
 
@@ -652,21 +753,14 @@ class mfundinfo(basicinfo):
         self._page = _download(self._url)
         parser = Parser()
         tree = parser.parse(self._page.text)
-        nodenet = [node.children()[0].children()[1] for node in nodevisitor.visit(tree)
-                   if isinstance(node, ast.VarStatement) and node.children()[0].children()[
-                       0].value == 'Data_millionCopiesIncome'][0]
-        name = [node.children()[0].children()[1] for node in nodevisitor.visit(tree)
-                if isinstance(node, ast.VarStatement) and (node.children()[0].children()[0].value == 'fS_name')][0]
-        self.name = name.value.strip('"')
-        tz_bj = dt.timezone(dt.timedelta(hours=8))
-        datel = [dt.datetime.fromtimestamp(int(nodenet.children()[i].children()[0].value) / 1e3, tz=tz_bj).replace(
-            tzinfo=None)
-            for i in range(len(nodenet.children()))]
-        ratel = [float(nodenet.children()[i].children()[1].value) for i in range(len(nodenet.children()))]
-        netvalue = [1]
-        for dailyrate in ratel:
-            netvalue.append(netvalue[-1] * (1 + dailyrate * 1e-4))
-        netvalue.remove(1)
+        jsvars = _jsvars(tree, 'Data_millionCopiesIncome', 'fS_name')
+        nodenet = jsvars['Data_millionCopiesIncome']
+        self.name = jsvars['fS_name'].value.strip('"')
+        points = [point.children() for point in nodenet.children()]
+        # the timestamps are in ms and in Beijing time, i.e. UTC+8
+        datel = pd.to_datetime([int(point[0].value) for point in points], unit='ms') + pd.Timedelta(hours=8)
+        ratel = np.array([float(point[1].value) for point in points])
+        netvalue = _mfnetvalue(1, ratel * 1e-4)
 
         df = pd.DataFrame(
             data={'date': datel, 'netvalue': netvalue, 'totvalue': netvalue, 'comment': [0 for _ in datel]})
@@ -759,10 +853,7 @@ class mfundinfo(basicinfo):
         date = date[::-1]
         earnrate = earnrate[::-1]
         comment = comment[::-1]
-        netvalue = [startvalue]
-        for earn in earnrate:
-            netvalue.append(netvalue[-1] * (1 + earn))
-        netvalue.remove(startvalue)
+        netvalue = _mfnetvalue(startvalue, np.array(earnrate))
 
         df = pd.DataFrame({'date': date, 'netvalue': netvalue, 'totvalue': netvalue, 'comment': comment})
         df = df[df['date'].isin(opendate)]
@@ -770,4 +861,88 @@ class mfundinfo(basicinfo):
         df = df[df['date'] <= yesterdayobj()]
         if len(df) != 0:
             self.price = self.price.append(df, ignore_index=True, sort=True)
+            self._advancestreams()
             return df
+
+
+_infoclass = {'fund': fundinfo, 'mfund': mfundinfo, 'index': indexinfo, 'cash': cashinfo}
+_registry = {}  # key: (weakref of info obj, creation timestamp)
+_registrypin = OrderedDict()  # strong refs of recently used info obj, in LRU order
+_registrypinsize = 64
+_registrylock = threading.RLock()
+_buildlocks = [threading.Lock() for _ in range(32)]  # builds of the keys with the same hash slot are serialized
+
+
+def _unregister(key):
+    '''
+    weakref callback generator, drop the registry entry once the info obj is garbage collected
+    '''
+
+    def callback(ref):
+        with _registrylock:
+            if key in _registry and _registry[key][0] is ref:
+                del _registry[key]
+
+    return callback
+
+
+def get_info(code, kind='fund', ttl=3600, **infokwds):
+    '''
+    factory of info objects with a process-wide registry, the same code and options give the shared obj
+    constructed before, as long as it is younger than ttl seconds. The registry only holds weak references
+    besides the latest used objects (see :func:`set_info_registry`), so objects nobody uses any more are evicted
+    automatically. It is thread safe and the same info obj is never constructed twice concurrently.
+    Note the returned obj is shared, modifying its price table (eg. by technical indicators) affects all other users.
+
+    :param code: string of the code, see the corresponding info class, ignored for kind='cash'
+    :param kind: string, 'fund' for fundinfo, 'mfund' for mfundinfo, 'index' for indexinfo, 'cash' for cashinfo
+    :param ttl: int or float, seconds before the registered obj is regarded as stale and constructed again
+    :param infokwds: keywords options for the info class, eg. fetch=True, path='data/'
+    :returns: info object
+    '''
+    if kind not in _infoclass:
+        raise Exception('no such kind of info class: %s' % kind)
+    if kind == 'cash':
+        code = 'mf'
+    key = (kind, code, tuple(sorted(infokwds.items())))
+    with _buildlocks[hash(key) % len(_buildlocks)]:
+        with _registrylock:
+            ref, created = _registry.get(key, (None, None))
+            obj = None if ref is None else ref()
+            if obj is not None and time.time() - created < ttl:
+                _pininfo(key, obj)
+                return obj
+        if kind == 'cash':
+            obj = cashinfo(**infokwds)
+        else:
+            obj = _infoclass[kind](code, **infokwds)
+        with _registrylock:
+            _registry[key] = (weakref.ref(obj, _unregister(key)), time.time())
+            _pininfo(key, obj)
+    return obj
+
+
+def _pininfo(key, obj):
+    _registrypin[key] = obj
+    _registrypin.move_to_end(key)
+    while len(_registrypin) > _registrypinsize:
+        _registrypin.popitem(last=False)
+
+
+def set_info_registry(pinsize=None, clear=False):
+    '''
+    configure the registry behind :func:`get_info`
+
+    :param pinsize: int, number of the latest used info objects kept alive by the registry itself,
+        0 means the registry only holds weak references
+    :param clear: bool, if True, drop all registered info objects
+    '''
+    global _registrypinsize
+    with _registrylock:
+        if pinsize is not None:
+            _registrypinsize = pinsize
+        if clear:
+            _registry.clear()
+            _registrypin.clear()
+        while len(_registrypin) > _registrypinsize:
+            _registrypin.popitem(last=False)
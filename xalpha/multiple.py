@@ -5,11 +5,48 @@ module for mul and mulfix class: fund combination management
 
 import pandas as pd
 from pyecharts.charts import Pie, ThemeRiver
-from xalpha.trade import xirrcal, vtradevolume, bottleneck, turnoverrate, trade
+from xalpha.trade import xirrcal, _xirrflows, _sorteddates, xirrseries, _prefixreports, vtradevolume, bottleneck, \
+    turnoverrate, trade, batchtrade, cashledger
 from xalpha.evaluate import evaluate
 from xalpha.indicator import indicator
 from xalpha.info import cashinfo, fundinfo
-from xalpha.cons import yesterdayobj, yesterdaydash, myround, convert_date
+import numpy as np
+from xalpha.cons import yesterdayobj, yesterdaydash, myround, convert_date, opendate, _xirr, _stackflows
+
+
+def _sumbydate(dates, values):
+    '''
+    sum the values on the same date, the values of each date are accumulated in the given order,
+    the same as summing them one by one, which keeps the cash of the merged cftable unchanged bit by bit
+
+    :param dates: np.array of datetime64
+    :param values: np.array of float
+    :returns: tuple of np.array, (sorted unique dates, sums)
+    '''
+    order = np.argsort(dates, kind='mergesort')
+    dates, values = dates[order], values[order].astype('float64')
+    uniquedates, start, counts = np.unique(dates, return_index=True, return_counts=True)
+    group = np.repeat(np.arange(len(uniquedates)), counts)
+    pos = np.arange(len(dates)) - start[group]
+    sums = np.zeros(len(uniquedates))
+    for i in range(counts.max() if len(counts) > 0 else 0):
+        # the i-th value of every date, each date appears at most once here
+        sums[group[pos == i]] += values[pos == i]
+    return uniquedates, sums
+
+
+def _tradedays(start, end):
+    '''
+    :param start: string or obj of datetime
+    :param end: string or obj of datetime
+    :returns: DatetimeIndex of trade days between start and end, with the last trade day before start inserted as
+        the first element for reference
+    '''
+    start, end = convert_date(start), convert_date(end)
+    days = pd.DatetimeIndex(opendate)
+    before = days[days < start]
+    reference = before[-1] if len(before) > 0 else start - pd.Timedelta(days=1)
+    return days[(days >= start) & (days <= end)].insert(0, reference)
 
 
 class mul():
@@ -23,16 +60,20 @@ class mul():
     :param save: boolean, when open the save option, info classes automatically save the class to files
     :param path: string, the file path prefix of IO, or object or engine from sqlalchemy to connect sql database
     :param form: string, the format of IO, options including: 'csv','sql'
+    :param snapshot: string, optional, the file path prefix of the trade snapshots for funds generated from status,
+        see :class:`xalpha.trade.trade`
+    :param precision: string, 'exact' or 'fast', the precision of the trades for funds generated from status,
+        see :class:`xalpha.trade.trade`
     '''
 
-    def __init__(self, *fundtradeobj, status=None, fetch=False, save=False, path='', form='csv'):
+    def __init__(self, *fundtradeobj, status=None, fetch=False, save=False, path='', form='csv', snapshot=None,
+                 precision='exact'):
         if not fundtradeobj:
             # warning: not a very good way to atoumatic generate these fund obj
             # because there might be some funds use round_down for share calculation, ie, label=2 must be given
             # unless you are sure corresponding funds are added to the droplist
-            fundtradeobj = []
-            for code in status.columns[1:]:
-                fundtradeobj.append(trade(fundinfo(code, fetch=fetch, save=save, path=path, form=form), status))
+            fundinfos = [fundinfo(code, fetch=fetch, save=save, path=path, form=form) for code in status.columns[1:]]
+            fundtradeobj = batchtrade(fundinfos, status, snapshot=snapshot, precision=precision)
         self.fundtradeobj = tuple(fundtradeobj)
         self.totcftable = self._mergecftb()
 
@@ -57,49 +98,82 @@ class mul():
         :returns: empty dict if nothing is remaining that date
             dict of various data on the trade positions
         '''
-        date = convert_date(date)
+        return self._summarytable([date]).drop('日期', axis=1)
+
+    def summary_history(self, dates):
+        '''
+        brief report tables of every funds and the combination investment on many dates at once,
+        the same as combsummary on each date but computed from cumulative sums of cftables
+
+        :param dates: list of string or obj of date
+        :returns: pd.DataFrame, combsummary tables of all dates stacked with an extra column 日期 in the front
+        '''
+        return self._summarytable(dates).reset_index(drop=True)
+
+    def _summarytable(self, dates):
+        '''
+        stacked combsummary tables, the index of fund rows is the position of the fund while the total row is the last
+        '''
+        dates = pd.DatetimeIndex(sorted(set([convert_date(date) for date in dates])))
         columns = ['基金名称', '基金代码', '当日净值', '单位成本', '持有份额', '基金现值', '基金总申购', '历史最大占用',
                    '基金持有成本', '基金分红与赎回', '换手率', '基金收益总额', '投资收益率']
-        summarydf = pd.DataFrame([], columns=columns)
-        for fund in self.fundtradeobj:
-            summarydf = summarydf.append(fund.dailyreport(date), ignore_index=True, sort=True)
-        tname = '总计'
-        tcode = 'total'
-        tunitvalue = float('NaN')
-        tunitcost = float('NaN')
-        tholdshare = float('NaN')
-        tcurrentvalue = summarydf['基金现值'].sum()
-        tpurchase = summarydf['基金总申购'].sum()
-        tbtnk = bottleneck(self.totcftable[self.totcftable['date'] <= date])
-        tcost = summarydf['基金持有成本'].sum()
-        toutput = summarydf['基金分红与赎回'].sum()
-        tturnover = turnoverrate(self.totcftable[self.totcftable['date'] <= date], date)
+        reports = []
+        for i, fund in enumerate(self.fundtradeobj):
+            report = fund._dailyreports(dates)
+            report.insert(0, '日期', dates)
+            report.index = [i] * len(dates)
+            reports.append(report)
+        sumcolumns = ['基金现值', '基金总申购', '基金持有成本', '基金分红与赎回', '基金收益总额']
+        # reducing along the fund axis adds funds one by one, the same order as summing the table column
+        tsum = pd.DataFrame(np.nansum(np.stack([report[sumcolumns].values for report in reports]), axis=0),
+                            columns=sumcolumns)
+        summarydf = pd.concat(reports)
+        _, tbtnk, tturnover = _prefixreports(self.totcftable, dates)
         # 计算的是总系统作为整体和外界的换手率，而非系统各成分之间的换手率
-        tearn = summarydf['基金收益总额'].sum()
-        trate = round(tearn / tbtnk * 100, 4)
-        trow = pd.DataFrame([[tname, tcode, tunitvalue, tunitcost, tholdshare,
-                              tcurrentvalue, tpurchase, tbtnk, tcost, toutput, tturnover, tearn, trate]],
-                            columns=columns)
-        summarydf = summarydf.append(trow, ignore_index=True, sort=True)
+        with np.errstate(all='ignore'):
+            trate = [round(float(r), 4) if np.isfinite(r) else r for r in tsum['基金收益总额'].values / tbtnk * 100]
+        trows = pd.DataFrame({'日期': dates, '基金名称': '总计', '基金代码': 'total', '当日净值': np.nan, '单位成本': np.nan,
+                              '持有份额': np.nan, '基金现值': tsum['基金现值'].values, '基金总申购': tsum['基金总申购'].values,
+                              '历史最大占用': tbtnk, '基金持有成本': tsum['基金持有成本'].values,
+                              '基金分红与赎回': tsum['基金分红与赎回'].values, '换手率': tturnover,
+                              '基金收益总额': tsum['基金收益总额'].values, '投资收益率': trate},
+                             index=[len(self.fundtradeobj)] * len(dates))
+        summarydf = pd.concat([summarydf, trows])[['日期'] + columns]
+        return summarydf.sort_values(by=['日期', '基金现值'], ascending=[True, False], kind='mergesort')
+
+    def refresh(self, status=None):
+        '''
+        incrementally extend all trades after the price tables of funds are updated or new rows are added
+        to the status table, see :meth:`xalpha.trade.trade.extend`
+
+        :param status: the full status table including the new rows, optional, rows later than the status
+            each trade is built on are taken as new rows
+        '''
+        mul._extendtrades(self.fundtradeobj, status)
+        self.totcftable = self._mergecftb()
 
-        return summarydf[columns].sort_values(by="基金现值", ascending=False)
+    def _extendtrades(fundtradeobj, status):
+        for fund in fundtradeobj:
+            if status is not None and fund.aim.code in status.columns:
+                if len(fund.status) > 0:
+                    newrows = status[status['date'] > fund.status['date'].max()]
+                else:
+                    newrows = status
+                fund.extend(newrows)
+            else:
+                fund.extend()
 
-    def _mergecftb(self):
+    def _mergecftb(self, fundtradeobj=None):
         '''
         merge the different cftable for different funds into one table
+
+        :param fundtradeobj: list of trade obj, default as all trades of the class
         '''
-        dtlist = []
-        for fund in self.fundtradeobj:
-            dtlist2 = []
-            for _, row in fund.cftable.iterrows():
-                dtlist2.append((row['date'], row['cash']))
-            dtlist.extend(dtlist2)
-
-        nndtlist = set([item[0] for item in dtlist])
-        nndtlist = sorted(list(nndtlist), key=lambda x: x)
-        reslist = []
-        for date in nndtlist:
-            reslist.append(sum([item[1] for item in dtlist if item[0] == date]))
+        if fundtradeobj is None:
+            fundtradeobj = self.fundtradeobj
+        cftb = pd.concat([fund.cftable[['date', 'cash']] for fund in fundtradeobj] +
+                         [pd.DataFrame({'date': pd.DatetimeIndex([]), 'cash': np.array([])})])
+        nndtlist, reslist = _sumbydate(cftb['date'].values.astype('datetime64[ns]'), cftb['cash'].values)
         df = pd.DataFrame(data={'date': nndtlist, 'cash': reslist})
         df = df[df['cash'] != 0]
         df = df.reset_index(drop=True)
@@ -111,6 +185,117 @@ class mul():
         '''
         return xirrcal(self.totcftable, self.fundtradeobj, date, guess)
 
+    def xirrrates(self, date=yesterdayobj(), guess=0.1):
+        '''
+        xirr rate of every fund in the combination, solved in one batch
+
+        :param date: string or obj of datetime, the virtually sell-all date
+        :param guess: floating number, the starting point of the numerical solution
+        :returns: pd.Series of xirr rates indexed by fund code, 0 for funds without trade before date
+        '''
+        flows = [_xirrflows(fund.cftable, [fund], date) for fund in self.fundtradeobj]
+        valid = [i for i, flow in enumerate(flows) if flow is not None]
+        rates = np.zeros(len(flows))
+        if valid:
+            rates[valid] = _xirr(*_stackflows([flows[i] for i in valid]), guess=guess)
+        return pd.Series(rates, index=[fund.aim.code for fund in self.fundtradeobj], name='xirr')
+
+    def xirr_series(self, dates, guess=0.1):
+        '''
+        xirr rates of the whole invest combination on a series of dates, much faster than calling xirrrate on each date
+
+        :param dates: list of string or obj of datetime, the virtually sell-all dates
+        :param guess: floating number, the starting point of the solution on the earliest date
+        :returns: pd.Series of xirr rates indexed by dates
+        '''
+        dates, order = _sorteddates(dates)
+        rede = 0
+        for fund in self.fundtradeobj:
+            rede = rede + fund._liquidation(dates[order])
+        rates = np.zeros(len(dates))
+        rates[order] = xirrseries(self.totcftable, dates[order], rede, guess)
+        return pd.Series(rates, index=dates, name='xirr')
+
+    def pnl_attribution(self, start, end=yesterdayobj(), chunksize=None):
+        '''
+        pnl attribution of every fund on every trade day. The pnl of a fund on one day, namely the change of its
+        value plus the cash of its cftable on the day, is split into four components:
+
+        * price: the change of floating profit, the fund value minus the holding cost of the positions
+        * dividend: fenhong in cash, or the value of reinvested shares
+        * realized: the profit of redeemed shares against their average holding cost
+        * fee: the purchase and redemption fees, together with the rounding of cash and shares in trades
+
+        The holding cost is the market value of shares when bought or reinvested, so the four components add up to
+        the pnl. All days are calculated in one vectorized pass on the cumulative shares of cftable.
+
+        :param start: string or obj of datetime, the first trade day of the attribution
+        :param end: string or obj of datetime, the last trade day of the attribution
+        :param chunksize: int, optional. If given, a generator of the tables on consecutive ranges of chunksize trade
+            days is returned instead, so that the memory is bounded by one chunk for very large books
+        :returns: pd.DataFrame indexed by date, with columns of two levels (fund code, component), such that
+            ``df.values.reshape(len(df), -1, 4)`` is the date × fund × component array
+        '''
+        days = _tradedays(start, end)
+        rows = [fund._pnlrows() for fund in self.fundtradeobj]
+        if chunksize is None:
+            return self._pnltable(days, rows)
+        # each chunk starts from the last day of the previous chunk as its reference day
+        return (self._pnltable(days[i:i + chunksize + 1], rows) for i in range(0, len(days) - 1, chunksize))
+
+    def _pnltable(self, dates, rows):
+        '''
+        :param dates: sorted DatetimeIndex, the first date is the reference day before the attribution
+        :param rows: list of the results of :meth:`xalpha.trade.trade._pnlrows` for funds
+        '''
+        res = np.stack([fund._pnl(dates, row) for fund, row in zip(self.fundtradeobj, rows)], axis=1)
+        columns = pd.MultiIndex.from_product([[fund.aim.code for fund in self.fundtradeobj],
+                                              ['price', 'dividend', 'realized', 'fee']])
+        return pd.DataFrame(res.reshape(len(dates) - 1, -1), index=dates[1:], columns=columns)
+
+    def iter_states(self, start, end=yesterdayobj()):
+        '''
+        generator of the states of the combination on each trade day, from one forward sweep along the cftable,
+        remtable and price table of every fund, so the memory of each step does not grow with the history.
+        The numbers are the same as those in dailyreport of each fund on the day.
+
+        :param start: string or obj of datetime
+        :param end: string or obj of datetime
+        :yields: dict with date together with share, lots, cost, value and cash, each of the latter is a dict
+            indexed by fund code: the holding share, the lots in remtable (shared with remtable, do not modify),
+            the holding cost (total purchase minus total redemption and fenhong), the fund value and the cash of
+            cftable on the day (positive for money back)
+        '''
+        days = _tradedays(start, end)
+        tables = [(fund.aim.code, fund.cftable['date'].tolist(), fund.cftable['cash'].tolist(),
+                   fund.cftable['share'].tolist(), fund.remtable['rem'].tolist(), fund.aim.price['date'].tolist(),
+                   fund.aim.price['netvalue'].tolist()) for fund in self.fundtradeobj]
+        # row pointer of cftable, row pointer of price table, total share, total input and total output of each fund
+        pointers = [[0, 0, 0., 0., 0.] for _ in tables]
+        for prev, day in zip(days[:-1], days[1:]):
+            state = {'date': day, 'share': {}, 'lots': {}, 'cost': {}, 'value': {}, 'cash': {}}
+            for (code, cfdates, cash, share, rems, pricedates, netvalues), ptr in zip(tables, pointers):
+                daycash = 0
+                while ptr[0] < len(cfdates) and cfdates[ptr[0]] <= day:
+                    k = ptr[0]
+                    ptr[2] += share[k]
+                    if cash[k] < 0:
+                        ptr[3] -= cash[k]
+                    else:
+                        ptr[4] += cash[k]
+                    if cfdates[k] > prev:
+                        daycash += cash[k]
+                    ptr[0] += 1
+                while ptr[1] < len(pricedates) and pricedates[ptr[1]] <= day:
+                    ptr[1] += 1
+                currentshare = myround(ptr[2])
+                state['share'][code] = currentshare
+                state['lots'][code] = rems[ptr[0] - 1] if ptr[0] > 0 else []
+                state['cost'][code] = myround(ptr[3]) - myround(ptr[4])
+                state['value'][code] = myround(currentshare * netvalues[ptr[1] - 1]) if ptr[1] > 0 else 0
+                state['cash'][code] = daycash
+            yield state
+
     def evaluation(self, start=None):
         '''
         give the evaluation object to analysis funds properties themselves instead of trades
@@ -175,16 +360,20 @@ class mulfix(mul, indicator):
     :param form: string, the format of IO, options including: 'csv','sql'
     :param totmoney: positive float, the total money as the input at the beginning
     :param cashobj: cashinfo object, which is designed to balance the cash in and out
+    :param snapshot: string, optional, the file path prefix of the trade snapshots of funds,
+        see :class:`xalpha.trade.trade`
+    :param precision: string, 'exact' or 'fast', the precision of the trades of funds generated from status,
+        see :class:`xalpha.trade.trade`
     '''
 
     def __init__(self, *fundtradeobj, status=None, fetch=False, save=False, path='', form='csv', totmoney=100000,
-                 cashobj=None):
-        super().__init__(*fundtradeobj, status=status, fetch=fetch, save=save, path=path, form=form)
+                 cashobj=None, snapshot=None, precision='exact'):
+        super().__init__(*fundtradeobj, status=status, fetch=fetch, save=save, path=path, form=form,
+                         snapshot=snapshot, precision=precision)
         if cashobj is None:
             cashobj = cashinfo()
         self.totmoney = totmoney
-        nst = mulfix._vcash(totmoney, self.totcftable, cashobj)
-        cashtrade = trade(cashobj, nst)
+        cashtrade = cashledger(cashobj, totmoney, self.totcftable)
         #		 super().__init__(*self.fundtradeobj, cashtrade)
         self.fundtradeobj = list(self.fundtradeobj)
         self.fundtradeobj.append(cashtrade)
@@ -192,30 +381,40 @@ class mulfix(mul, indicator):
         btnk = bottleneck(self.totcftable)
         if btnk > totmoney:
             raise Exception('the initial total cash is too low')
-        self.totcftable = pd.DataFrame(data={'date': [nst.iloc[0].date], 'cash': [-totmoney]})
+        self.totcftable = pd.DataFrame(data={'date': [cashtrade.status.iloc[0].date], 'cash': [-totmoney]})
 
-    def _vcash(totmoney, totcftable, cashobj):
+    def refresh(self, status=None):
         '''
-        return a virtue status table with a mf(cash) column based on the given tot money and cftable
+        incrementally extend all trades as :meth:`mul.refresh`, the virtual cash account is extended accordingly.
+        Note the netvalue table is generated again, so bcmkset should be called again if needed.
+
+        :param status: the full status table including the new rows, optional
         '''
-        cashl = []
-        cashl.append(totmoney + totcftable.iloc[0].cash)
-        for i in range(len(totcftable) - 1):
-            date = totcftable.iloc[i + 1].date
-            delta = totcftable.iloc[i + 1].cash
-            if delta < 0:
-                cashl.append(myround(delta / cashobj.price[cashobj.price['date'] <= date].iloc[-1].netvalue))
-            else:
-                cashl.append(delta)
-        datadict = {'date': totcftable.loc[:, 'date'], 'mf': cashl}
-        return pd.DataFrame(data=datadict)
+        cashtrade = self.fundtradeobj[-1]
+        mul._extendtrades(self.fundtradeobj[:-1], status)
+        fundcftable = self._mergecftb(self.fundtradeobj[:-1])
+        btnk = bottleneck(fundcftable)
+        if btnk > self.totmoney:
+            raise Exception('the initial total cash is too low')
+        nst = cashledger._vstatus(self.totmoney, fundcftable, cashtrade.aim)
+        cashtrade.extend(nst[nst['date'] > cashtrade.status['date'].max()])
+        self.price = None
 
     def unitvalue(self, date=yesterdayobj()):
         '''
         :returns: float at unitvalue of the whole investment combination
         '''
         date = convert_date(date)
+        return self._unitvalues(pd.DatetimeIndex([date]))[0]
+
+    def _unitvalues(self, dates):
+        '''
+        vectorized unitvalue on sorted dates, the current values of all funds and cash are summed in order
+
+        :param dates: sorted DatetimeIndex
+        :returns: np.array of float
+        '''
         res = 0
         for fund in self.fundtradeobj:
-            res += fund.briefdailyreport(date).get('currentvalue', 0)
+            res = res + fund._currentvalues(dates)
         return res / self.totmoney
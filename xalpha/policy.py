@@ -2,9 +2,54 @@
 '''
 modules for policy making: generate status table for backtesting
 '''
+import numpy as np
 import pandas as pd
-from xalpha.cons import yesterdaydash, opendate, myround
+from xalpha.cons import yesterdaydash, opendate, myround, convert_date
 from xalpha.record import record
+from xalpha.trade import trade
+
+
+def _featurecol(infoobj, col, features):
+    '''
+    :param infoobj: info object
+    :param col: string of the column name in price table, or dict as the spec of a technical indicator column
+        from the feature store of infoobj, eg. {'indicator': 'ma', 'window': 10}, the optional key 'column'
+        chooses one of the columns given by the indicator, the first one by default
+    :param features: dict, the column of the spec is added into it
+    :returns: string of the column name
+    '''
+    if not isinstance(col, dict):
+        return col
+    params = dict(col)
+    name = params.pop('indicator')
+    column = params.pop('column', None)
+    frame = infoobj.feature(name, **params)
+    if column is None:
+        column = frame.columns[0]
+    features[column] = frame[column]
+    return column
+
+
+def _opendays(times):
+    '''
+    :param times: pd.DatetimeIndex
+    :returns: np.array of bool, whether each day is a trading day
+    '''
+    return np.asarray(times.strftime('%Y-%m-%d').isin(opendate))
+
+
+def _daymask(times, days):
+    '''
+    :param times: pd.DatetimeIndex
+    :param days: list or pd.DatetimeIndex of dates
+    :returns: np.array of bool, the same as ``date in days`` for each date of times
+    '''
+    if isinstance(days, pd.DatetimeIndex):
+        return np.asarray(times.isin(days))
+    if isinstance(days, (list, tuple)):
+        # strings in a list are never equal to the timestamps
+        return np.asarray(times.isin([pd.Timestamp(day) for day in days if not isinstance(day, str)]))
+    return np.array([date in days for date in times], dtype=bool)
 
 
 class policy(record):
@@ -16,12 +61,15 @@ class policy(record):
     :param end: string or object of date, the ending date for policy running
     :param totmoney: float or int, characteristic money value, 
         not necessary to be the total amount of money
+    :param features: dict, optional, extra columns of the price table used by the policy, indexed the same as
+        infoobj.price, they are added to the price table of the policy only
     '''
 
-    def __init__(self, infoobj, start, end=yesterdaydash(), totmoney=100000):
+    def __init__(self, infoobj, start, end=yesterdaydash(), totmoney=100000, features=None):
         self.aim = infoobj
         self.totmoney = totmoney
-        self.price = infoobj.price[(infoobj.price['date'] >= start) & (infoobj.price['date'] <= end)]
+        price = infoobj.price if not features else infoobj.price.assign(**features)
+        self.price = price[(price['date'] >= start) & (price['date'] <= end)]
         if len(self.price) == 0:
             self.start = convert_date(start)
             self.end = convert_date(end)
@@ -32,8 +80,7 @@ class policy(record):
             datel = []
             actionl = []
             times = pd.date_range(self.start, self.end)
-            for date in times:
-                action = self.status_gen(date)
+            for date, action in zip(times, self.status_vector(times)):
                 if action > 0:
                     datel.append(date)
                     actionl.append(action)
@@ -52,6 +99,33 @@ class policy(record):
         '''
         raise NotImplementedError
 
+    def status_vector(self, times):
+        '''
+        give policy decisions of all days at once. The default calls status_gen day by day, subclasses may override
+        it instead, with vectorized conditions over the numpy arrays of the price table, and a state machine
+        stepping only on the days picked out by the conditions, see the policies below.
+
+        :param times: pd.DatetimeIndex of all days from start to end
+        :returns: list of float, the decision of each day as status_gen
+        '''
+        return [self.status_gen(date) for date in times]
+
+    def _lastrows(self, times):
+        '''
+        :param times: pd.DatetimeIndex
+        :returns: np.array of int, the index of the last row of the price table up to each day
+        '''
+        return np.searchsorted(self.price['date'].values, times.values, side='right') - 1
+
+    def backtest(self, precision='exact'):
+        '''
+        backtest the policy on its aim
+
+        :param precision: string, 'exact' or 'fast', see :class:`xalpha.trade.trade`
+        :returns: trade obj of the aim with the status table generated by the policy
+        '''
+        return trade(self.aim, self.status, precision=precision)
+
 
 class buyandhold(policy):
     '''
@@ -59,16 +133,14 @@ class buyandhold(policy):
     始终选择分红再投入
     '''
 
-    def status_gen(self, date):
-        if date == self.start:
-            return self.totmoney
-        elif date in self.aim.specialdate:
-            if self.price[self.price['date'] == date].iloc[0].comment > 0:
-                return 0.05
-            else:
-                return 0
-        else:
-            return 0
+    def status_vector(self, times):
+        actions = [0] * len(times)
+        if self.aim.specialdate:
+            rows = self.price[self.price['date'].isin(self.aim.specialdate) & (self.price['comment'] > 0)]
+            for i in (rows['date'] - self.start).dt.days:
+                actions[i] = 0.05
+        actions[0] = self.totmoney
+        return actions
 
 
 class scheduled(policy):
@@ -87,11 +159,8 @@ class scheduled(policy):
         self.times = times
         super().__init__(infoobj, start, end, totmoney)
 
-    def status_gen(self, date):
-        if date in self.times:
-            return self.totmoney
-        else:
-            return 0
+    def status_vector(self, times):
+        return [self.totmoney if scheduled else 0 for scheduled in _daymask(times, self.times)]
 
 
 class scheduled_tune(scheduled):
@@ -108,15 +177,17 @@ class scheduled_tune(scheduled):
         self.piece = piece
         super().__init__(infoobj, totmoney, times)
 
-    def status_gen(self, date):
-        if date in self.times:
-            value = self.price[self.price['date'] >= date].iloc[0].netvalue
+    def status_vector(self, times):
+        actions = [0] * len(times)
+        days = np.nonzero(_daymask(times, self.times))[0]
+        netvalue = self.price['netvalue'].values
+        # the netvalue of the first row on or after each scheduled day
+        for i, k in zip(days, np.searchsorted(self.price['date'].values, times.values[days], side='left')):
             for term in self.piece:
-                if value <= term[0]:
-                    return term[1] * self.totmoney
-            return 0
-        else:
-            return 0
+                if netvalue[k] <= term[0]:
+                    actions[i] = term[1] * self.totmoney
+                    break
+        return actions
 
 
 class grid(policy):
@@ -151,20 +222,33 @@ class grid(policy):
         self.sellpercent = sellpercent
         super().__init__(infoobj, start, end, totmoney)
 
-    def status_gen(self, date):
+    def status_vector(self, times):
         # 过滤交易日这一需求，交给各个类自由裁量，这里网格类就需要过掉非交易日干扰，
         # 而定投类中则不过掉，遇到非交易日顺延定投更合理些
-        if date.strftime('%Y-%m-%d') not in opendate:
-            return 0
-
-        if date == self.start:
-            if self.buypercent[0] == 0:
-                self.pos += 1
-                return myround(self.totmoney / self.division)
-            else:
-                return 0
-        value = self.price[self.price['date'] <= date].iloc[-1].loc['netvalue']
-        valueb = self.price[self.price['date'] <= date].iloc[-2].loc['netvalue']
+        actions = [0] * len(times)
+        isopen = _opendays(times)
+        if isopen[0] and self.buypercent[0] == 0:
+            self.pos += 1
+            actions[0] = myround(self.totmoney / self.division)
+        netvalue = self.price['netvalue'].values
+        last = self._lastrows(times)
+        value, valueb = netvalue[last], netvalue[last - 1]
+        # only the days crossing some grid point may trade
+        cross = np.zeros(len(times), dtype=bool)
+        for buypt in self.buypts:
+            cross |= ((value - buypt) <= 0) & ((valueb - buypt) > 0)
+        for sellpt in self.sellpts:
+            cross |= ((value - sellpt) >= 0) & ((valueb - sellpt) < 0)
+        cross &= isopen & (last >= 1)
+        cross[0] = False
+        for i in np.nonzero(cross)[0]:
+            actions[i] = self._step(value[i], valueb[i])
+        return actions
+
+    def _step(self, value, valueb):
+        '''
+        the action of a trading day with the netvalue and that of the day before, the position is updated
+        '''
         action = 0
         for i, buypt in enumerate(self.buypts):
             if (value - buypt) <= 0 and (valueb - buypt) > 0 and self.pos <= i:
@@ -184,7 +268,9 @@ class indicator_cross(policy):
     :param info: info object, trading aim of the policy
     :param col: a tuple with two strings, eg ('netvalue','MA10'), when the left one is over the 
         right one, we buy and otherwise we sell, that is the core of cross policy, you can choose 
-        any two columns as you like, as long as you generate them on the info object before input
+        any two columns as you like, as long as you generate them on the info object before input,
+        or give the spec dict of an indicator column instead, eg ('netvalue', {'indicator': 'ma', 'window': 10}),
+        see :func:`_featurecol`
         也即左栏数据从下向上穿过右栏数据时，买入；反之亦然
     :param start: date str of policy starting
     :param end: date str of policy ending
@@ -193,39 +279,31 @@ class indicator_cross(policy):
     '''
 
     def __init__(self, infoobj, col, start, end=yesterdaydash(), totmoney=100000):
-        self.col = col
+        features = {}
+        self.col = tuple(_featurecol(infoobj, c, features) for c in col)
         self.pos = 0
-        super().__init__(infoobj, start, end, totmoney)
-
-    def status_gen(self, date):
-        if date.strftime('%Y-%m-%d') not in opendate:
-            return 0
-        rows = self.price[self.price['date'] <= date]
-        if len(rows) == 1:
-            return 0
-        valuel = rows.iloc[-1].loc[self.col[0]]
-        valuelb = rows.iloc[-2].loc[self.col[0]]
-        valuer = rows.iloc[-1].loc[self.col[1]]
-        valuerb = rows.iloc[-2].loc[self.col[1]]
-        cond = (valuerb - valuelb) * (valuer - valuel)
-
-        if cond > 0:
-            return 0
-        if cond == 0 and (valuer - valuel == 0):
-            return 0
-        if (cond == 0 and (valuer - valuel) != 0) or cond < 0:
-            if valuer > valuel:
+        super().__init__(infoobj, start, end, totmoney, features=features)
+
+    def status_vector(self, times):
+        actions = [0] * len(times)
+        last = self._lastrows(times)
+        left, right = self.price[self.col[0]].values, self.price[self.col[1]].values
+        valuel, valuelb = left[last], left[last - 1]
+        valuer, valuerb = right[last], right[last - 1]
+        with np.errstate(invalid='ignore'):
+            cond = (valuerb - valuelb) * (valuer - valuel)
+            cross = ((cond == 0) & (valuer - valuel != 0)) | (cond < 0)
+        cross &= _opendays(times) & (last >= 1)
+        for i in np.nonzero(cross)[0]:
+            if valuer[i] > valuel[i]:
                 if self.pos == 1:
                     self.pos = 0
-                    return -1
-                else:
-                    return 0
+                    actions[i] = -1
             else:
                 if self.pos == 0:
                     self.pos = 1
-                    return self.totmoney
-                else:
-                    return 0
+                    actions[i] = self.totmoney
+        return actions
 
 
 class indicator_points(policy):
@@ -233,7 +311,8 @@ class indicator_points(policy):
     基于技术指标的策略生成类之一，给出技术指标的多个阈值，基于这些点数值进行交易
 
     :param infoobj: info object, trading aim of the policy
-    :param col: str, stands for the tracking column of price table, eg. 'netvalue' or 'PSY'
+    :param col: str, stands for the tracking column of price table, eg. 'netvalue' or 'PSY',
+        or the spec dict of an indicator column, see :func:`_featurecol`
     :param buy: list of tuple, eg [(0.1,1),(0.2,2),(0.3,5)]. buy 1/(1+2+5) of totmoney, when the col
         value approach 0.1 and so on.
     :param sell: similar list of tuple as buy input. the difference is you can omit setting of sell list,
@@ -249,7 +328,8 @@ class indicator_points(policy):
 
     def __init__(self, infoobj, start, col, buy, sell=None, buylow=True, end=yesterdaydash(), totmoney=100000):
         self.pos = 0
-        self.col = col
+        features = {}
+        self.col = _featurecol(infoobj, col, features)
         self.buylow = buylow
         self.selllevel = 0
         bdivision = sum([it[1] for it in buy])
@@ -265,16 +345,30 @@ class indicator_points(policy):
         else:
             self.sell = sell
 
-        super().__init__(infoobj, start, end, totmoney)
-
-    def status_gen(self, date):
-        if date.strftime('%Y-%m-%d') not in opendate:
-            return 0
-        rows = self.price[self.price['date'] <= date]
-        if len(rows) == 1:
-            return 0
-        value = rows.iloc[-1].loc[self.col]
-        valueb = rows.iloc[-2].loc[self.col]
+        super().__init__(infoobj, start, end, totmoney, features=features)
+
+    def status_vector(self, times):
+        actions = [0] * len(times)
+        last = self._lastrows(times)
+        values = self.price[self.col].values
+        value, valueb = values[last], values[last - 1]
+        judge = 1 if self.buylow is True else -1
+        # only the days crossing some point may trade
+        cross = np.zeros(len(times), dtype=bool)
+        with np.errstate(invalid='ignore'):
+            for term in self.buy:
+                cross |= (judge * (value - term[0]) <= 0) & (0 < judge * (valueb - term[0]))
+            for term in self.sell or []:
+                cross |= (judge * (value - term[0]) >= 0) & (0 > judge * (valueb - term[0]))
+        cross &= _opendays(times) & (last >= 1)
+        for i in np.nonzero(cross)[0]:
+            actions[i] = self._step(value[i], valueb[i])
+        return actions
+
+    def _step(self, value, valueb):
+        '''
+        the action of a trading day with the col value and that of the day before, the positions are updated
+        '''
         action = 0
         if self.buylow is True:
             judge = 1
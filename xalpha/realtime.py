@@ -101,6 +101,26 @@ def rfundinfo(code, label=1, fetch=False, save=False, path='', form='csv'):
     return fundobj
 
 
+def rtindicator(infoobj):
+    '''
+    give the streamed technical indicators of the fund with todays realtime estimate netvalue, the states of the
+    streams registered by infoobj.stream are left untouched, so it can be called repeatedly within the trading day
+
+    :param infoobj: fundinfo object with streams registered, eg. infoobj.stream('macd')
+    :returns: pd.DataFrame of one row with date, netvalue and the columns of the streams
+    '''
+    rt = rtdata(infoobj.code)
+    rtdate = dt.datetime.combine(rt.time, dt.time.min)
+    if (rtdate - infoobj.price.iloc[-1].date).days > 0:
+        df = infoobj.peekstreams([rt.rtvalue])
+        df.insert(0, 'date', [rtdate])
+    else:  # the netvalue of the day is already in the price table
+        df = infoobj.price.iloc[-1:].reset_index(drop=True)
+        columns = [c for st, _ in getattr(infoobj, '_streams', {}).values() for c in st.columns]
+        df = df[['date', 'netvalue'] + list(dict.fromkeys(columns))]
+    return df
+
+
 class review():
     '''
     review policys and give the realtime purchase suggestions
@@ -129,7 +149,7 @@ class review():
                     sug = '买入%s元' % warn[2]
                 elif warn[2] < 0:
                     ratio = -warn[2] / 0.005 * 100
-                    share = trade(fundinfo(warn[1]), policy.status).briefdailyreport().get('currentshare', 0)
+                    share = trade(policy.aim, policy.status).briefdailyreport().get('currentshare', 0)
                     share = -warn[2] / 0.005 * share
                     sug = '卖出%s%%的份额，也即%s份额' % (ratio, share)
                 self.message.append('根据%s计划，建议%s，%s(%s)' % (warn[3], sug, warn[0], warn[1]))
@@ -8,7 +8,8 @@ as the nested list structure is very fragile and tend to induce unpredicatble be
 we strongly recommended anytime when rem data serves as function paramters, 
 only utilize functions from this module
 '''
-from xalpha.cons import myround, convert_date
+import numpy as np
+from xalpha.cons import myround, convert_date, tocents, fromcents
 
 _errmsg = 'One cannot move share before the lastest operation'
 
@@ -53,26 +54,26 @@ def sell(remc, share, date):
     rem = copy(remc)
     share = myround(share)
     date = convert_date(date)
-    totposition = sum([pos[1] for pos in rem])  # the remaining shares
+    # prefix sums of positions, accumulated in the same order as sum() so that the comparisons are unchanged
+    cumshare = [0] + np.cumsum([pos[1] for pos in rem]).tolist()
+    totposition = cumshare[-1]  # the remaining shares
     if totposition == 0:
         return ([], [])
     if (date - rem[-1][0]).days < 0:
         raise Exception(_errmsg)
     if share > totposition:
         share = totposition  # not raise error when you sell more than you buy
+    roundshare = fromcents(tocents(cumshare[1:]))
     soldrem = []
     newrem = []
     for i, pos in enumerate(rem):
-        if share > myround(sum([rem[j][1] for j in range(i + 1)])):
-            soldrem.append(rem[i])
-        elif share == myround(sum([rem[j][1] for j in range(i + 1)])):
-            soldrem.append(rem[i])
-        elif share < myround(sum([rem[j][1] for j in range(i + 1)])):
-            if share > sum([rem[j][1] for j in range(i)]):
-                soldrem.append([rem[i][0], share - sum([rem[j][1] for j in range(i)])])
-                newrem.append([rem[i][0], sum([rem[j][1] for j in range(i + 1)]) - share])
-            elif share <= sum([rem[j][1] for j in range(i)]):
-                newrem.append(rem[i])
+        if share >= roundshare[i]:
+            soldrem.append(pos)
+        elif share > cumshare[i]:
+            soldrem.append([pos[0], share - cumshare[i]])
+            newrem.append([pos[0], cumshare[i + 1] - share])
+        else:
+            newrem.append(pos)
     return (soldrem, newrem)
 
 
@@ -90,5 +91,6 @@ def trans(remc, coef, date):
         return []
     if (date - rem[-1][0]).days <= 0:
         raise Exception(_errmsg)
-    newrem = [[item[0], myround(item[1] * coef)] for item in rem]
+    shares = fromcents(tocents([item[1] * coef for item in rem])).tolist()
+    newrem = [[item[0], share] for item, share in zip(rem, shares)]
     return newrem
@@ -3,10 +3,39 @@
 module for trade class
 '''
 import datetime as dt
+import hashlib
+import heapq
+import json
+import pickle
+import numpy as np
 import pandas as pd
 from pyecharts.charts import Line, Bar
 import xalpha.remain as rm
-from xalpha.cons import convert_date, xirr, myround, yesterdayobj
+from xalpha.cons import convert_date, myround, yesterdayobj, tocents, fromcents, _xirr, _yearfrac
+
+# bump it whenever the content of cftable or remtable changes, so that old snapshots are abandoned
+_snapshotversion = 2
+
+
+def _xirrflows(cftable, trades, date):
+    '''
+    the cashflow arrays for xirr, with all holding positions of trades virtually sold out on date
+
+    :returns: tuple of np.array, (year fractions, amounts), None if there is no cashflow before date
+    '''
+    date = convert_date(date)
+    partcftb = cftable[cftable['date'] <= date]
+    if len(partcftb) == 0:
+        return None
+    rede = 0
+    for fund in trades:
+        partremtb = fund.remtable[fund.remtable['date'] <= date]
+        if len(partremtb) == 0:  # the fund is not bought yet in the combination
+            continue
+        rede += fund.aim.shuhui(fund.briefdailyreport(date).get('currentshare', 0), date, partremtb.iloc[-1].rem)[1]
+    times = _yearfrac(list(partcftb['date']) + [date])
+    amounts = np.append(partcftb['cash'].values, rede)
+    return times, amounts
 
 
 def xirrcal(cftable, trades, date, guess):
@@ -22,17 +51,47 @@ def xirrcal(cftable, trades, date, guess):
         as a starting point for the numerical solution
     :returns: the IRR as a single floating number
     '''
-    date = convert_date(date)
-    partcftb = cftable[cftable['date'] <= date]
-    if len(partcftb) == 0:
+    flows = _xirrflows(cftable, trades, date)
+    if flows is None:
         return 0
-    cashflow = [(row['date'], row['cash']) for i, row in partcftb.iterrows()]
-    rede = 0
-    for fund in trades:
-        rede += fund.aim.shuhui(fund.briefdailyreport(date).get('currentshare', 0), date,
-                                fund.remtable[fund.remtable['date'] <= date].iloc[-1].rem)[1]
-    cashflow.append((date, rede))
-    return xirr(cashflow, guess)
+    return _xirr(*flows, guess=guess)
+
+
+def _sorteddates(dates):
+    '''
+    :param dates: list of string or obj of datetime
+    :returns: tuple, (DatetimeIndex of dates, the permutation to sort them)
+    '''
+    dates = pd.DatetimeIndex([convert_date(date) for date in dates])
+    return dates, np.argsort(dates.values, kind='mergesort')
+
+
+def xirrseries(cftable, dates, rede, guess=0.1):
+    '''
+    calculate the xirr rates on a series of dates, the cashflows are prefixes of the cftable
+    together with the virtual sell-all cash on each date. Each solution starts from the root of the previous date.
+
+    :param cftable: cftable (pd.Dateframe) with date and cash column
+    :param dates: sorted DatetimeIndex, the dates when virtually all holding positions being sold
+    :param rede: np.array, the cash of selling all holding positions on each date
+    :param guess: floating number, the starting point of the solution on the first date
+    :returns: np.array of xirr rates, 0 for dates before any trade as xirrcal
+    '''
+    rates = np.zeros(len(dates))
+    if len(cftable) == 0:
+        return rates
+    cfdates = cftable['date'].values.astype('datetime64[ns]')
+    cash = cftable['cash'].values.astype('float64')
+    times = _yearfrac(cfdates)
+    endtimes = _yearfrac(dates, start=cfdates[0])
+    ks = np.searchsorted(cfdates, dates.values, side='right')
+    for j, k in enumerate(ks):
+        if k == 0:
+            continue
+        rates[j] = _xirr(np.append(times[:k], endtimes[j]), np.append(cash[:k], rede[j]), guess=guess)
+        if np.isfinite(rates[j]):
+            guess = rates[j]
+    return rates
 
 
 def bottleneck(cftable):
@@ -43,8 +102,8 @@ def bottleneck(cftable):
     '''
     if len(cftable) == 0:
         return 0
-    # cftable = cftable.reset_index(drop=True) # unnecessary as iloc use natural rows instead of default index
-    inputl = [-sum(cftable.iloc[:i].cash) for i in range(1, len(cftable) + 1)]
+    # cumsum accumulates in the same order as sum() on every prefix of the cash column
+    inputl = -np.cumsum(cftable['cash'].values)
     return myround(max(inputl))
 
 
@@ -66,6 +125,31 @@ def turnoverrate(cftable, end=yesterdayobj()):
     return turnover * 365 / (end - start).days
 
 
+def _prefixreports(cftable, dates):
+    '''
+    vectorized bottleneck and turnoverrate on the part of cftable no later than each date,
+    the cumulative sums accumulate in the same order as the scalar functions
+
+    :param cftable: pd.DataFrame of cftable with date and cash columns
+    :param dates: sorted DatetimeIndex
+    :returns: tuple of np.array, (number of cftable rows no later than each date, bottleneck, turnoverrate)
+    '''
+    cfdates = cftable['date'].values.astype('datetime64[ns]')
+    cash = cftable['cash'].values.astype('float64')
+    ks = np.searchsorted(cfdates, dates.values, side='right')
+    btnk = np.zeros(len(dates))
+    turnover = np.zeros(len(dates))
+    valid = ks > 0
+    if valid.any():
+        k1 = ks[valid] - 1
+        btnk[valid] = fromcents(tocents(np.maximum.accumulate(-np.cumsum(cash))[k1]))
+        days = (dates[valid] - pd.Timestamp(cfdates[0])).days.values
+        with np.errstate(all='ignore'):
+            rate = np.cumsum(np.abs(cash))[k1] / btnk[valid] / 2. * 365 / days
+        turnover[valid] = np.where(days > 0, rate, 0)
+    return ks, btnk, turnover
+
+
 def vtradevolume(cftable, freq='D', bar_category_gap='35%', **vkwds):
     '''
     aid function on visualization of trade summary
@@ -102,6 +186,293 @@ def vtradevolume(cftable, freq='D', bar_category_gap='35%', **vkwds):
     return bar
 
 
+def _tradeevent(aim, date, value, rem, totshare):
+    '''
+    cash and share change of one trade aim on one day with a record in status table and/or a special comment
+    关于对于一个基金多个操作存在于同一交易日的说明：无法处理历史买入第一笔同时是分红日的情形, 事实上也不存在这种情形。无法处理一日多笔买卖的情形。
+    同一日既有卖也有买不现实，多笔买入只能在 csv 上合并记录，由此可能引起份额计算 0.01 的误差。可以处理分红日买入卖出的情形。
+    分级份额折算日封闭无法买入，所以程序直接忽略当天的买卖。因此不会出现多个操作共存的情形。
+
+    :param aim: info obj
+    :param date: pd.Timestamp of the day
+    :param value: float of the record in status table, None if there is no record to deal with on the day
+    :param rem: rem before the day
+    :param totshare: float, total share before the day
+    :returns: tuple of four elements, date, cash and share of the new cftable row, and the new rem
+    '''
+    label = 0
+    cash = 0
+    share = 0
+    rdate = date
+    oldrem = rem
+    if value is not None:
+        # deal with buy and sell and label the fenhongzaitouru, namely one label a 0.05 in the original table to label fenhongzaitouru
+        fenhongmark = round(10 * value - int(10 * value), 1)
+        if fenhongmark == 0.5:
+            label = 1  # fenhong reinvest
+            value = round(value, 1)
+
+        if value > 0:  # value stands for purchase money
+            rdate, dcash, dshare = aim.shengou(value, date)
+            rem = rm.buy(rem, dshare, rdate)
+
+        elif value < -0.005:  # value stands for redemp share
+            rdate, dcash, dshare = aim.shuhui(-value, date, oldrem)
+            _, rem = rm.sell(rem, -dshare, rdate)
+        elif value >= -0.005 and value < 0:
+            # value now stands for the ratio to be sold in terms of remain positions, -0.005 stand for sell 100%
+            ratio = -value / 0.005
+            rdate, dcash, dshare = aim.shuhui(totshare * ratio, date, oldrem)
+            _, rem = rm.sell(rem, -dshare, rdate)
+        else:  # in case value=0, when specialday is in record day
+            rdate, dcash, dshare = date, 0, 0
+
+        cash += dcash
+        share += dshare
+    if date in aim.specialdate:  # deal with fenhong and xiazhe
+        comment = aim.price[aim.price['date'] == date].iloc[0].loc['comment']
+        if isinstance(comment, float):
+            if comment < 0:
+                # xiazhe are seperately carried out based on different purchase date
+                dcash2, dshare2 = 0, sum(fromcents(tocents([sh * (-comment - 1) for _, sh in rem])).tolist())
+                rem = rm.trans(rem, -comment, date)
+            elif comment > 0 and label == 0:
+                dcash2, dshare2 = myround(totshare * comment), 0
+                rem = rm.copy(rem)
+
+            elif comment > 0 and label == 1:
+                dcash2, dshare2 = 0, myround(totshare *
+                                             (comment / aim.price[aim.price['date'] == date].iloc[0].netvalue))
+                rem = rm.buy(rem, dshare2, date)
+
+            cash += dcash2
+            share += dshare2
+        else:
+            raise Exception('comments not recoginized')
+    return rdate, cash, share, rem
+
+
+def _pricearrays(aim):
+    '''
+    :returns: tuple of the price table of aim in np.array, (dates in datetime64, netvalues, comments),
+        together with the set of special days
+    '''
+    price = aim.price
+    comments = price['comment'].values if 'comment' in price.columns else np.zeros(len(price))
+    return (price['date'].values.astype('datetime64[ns]'), price['netvalue'].values.astype('float64'), comments,
+            set(aim.specialdate))
+
+
+def _fastbuy(rem, share, date):
+    '''
+    float counterpart of :func:`xalpha.remain.buy`
+    '''
+    if rem and rem[-1][0] == date:
+        return rem[:-1] + [[date, rem[-1][1] + share]]
+    return rem + [[date, share]]
+
+
+def _fastsell(aim, rem, share, tradedate, netvalue):
+    '''
+    sell share from rem in first-in-first-out order with float arithmetic, the redemption fee of all sold lots
+    is aggregated in one dot product instead of rounded lot by lot
+
+    :returns: tuple of cash, share change and the new rem
+    '''
+    if not rem:
+        return 0., 0., []
+    lots = np.array([lot[1] for lot in rem], dtype='float64')
+    cum = np.cumsum(lots)
+    share = min(share, cum[-1])
+    sold = np.minimum(lots, np.maximum(share - (cum - lots), 0))
+    fee = 0.
+    if hasattr(aim, 'fee_rates'):
+        idx = np.nonzero(sold)[0]
+        fee = np.dot(sold[idx], aim.fee_rates([(tradedate - rem[i][0]).days for i in idx])) * 1e-2
+    newrem = [[lot[0], left] for lot, left in zip(rem, lots - sold) if left > 0]
+    return (share - fee) * netvalue, -share, newrem
+
+
+def _fasttradeevent(aim, prices, date, value, rem, totshare, first=False):
+    '''
+    float counterpart of :func:`_tradeevent` for trades in fast precision, no rounding is applied on cash and share,
+    and redemption fees are aggregated, see :func:`_fastsell`
+
+    :param prices: the result of :func:`_pricearrays` of aim
+    :param first: bool, whether it is the first purchase, where neither the fenhong reinvest mark nor the special day
+        is dealt with, the same as the exact precision
+    :returns: the same as :func:`_tradeevent`
+    '''
+    pricedates, netvalues, comments, specialdate = prices
+    label = 0
+    cash = 0.
+    share = 0.
+    rdate = date
+    if value is not None:
+        fenhongmark = round(10 * value - int(10 * value), 1)
+        if fenhongmark == 0.5 and not first:
+            label = 1  # fenhong reinvest
+            value = round(value, 1)
+        # trade on the first day no earlier than the record, which is in the price table, see _tradestate.step
+        p = np.searchsorted(pricedates, date.to_datetime64(), side='left')
+        if value > 0:
+            rdate = pd.Timestamp(pricedates[p])
+            cash, share = -value, value / (1 + aim.rate * 1e-2) / netvalues[p]
+            rem = _fastbuy(rem, share, rdate)
+        elif value < 0:
+            sh = -value if value < -0.005 else totshare * (-value / 0.005)
+            rdate = pd.Timestamp(pricedates[p])
+            cash, share, rem = _fastsell(aim, rem, sh, rdate, netvalues[p])
+    if not first and date in specialdate:
+        p = np.searchsorted(pricedates, date.to_datetime64(), side='left')
+        comment = comments[p]
+        if comment < 0:
+            held = sum(lot[1] for lot in rem)
+            share += held * (-comment - 1)
+            rem = [[lot[0], lot[1] * -comment] for lot in rem]
+        elif comment > 0 and label == 0:
+            cash += totshare * comment
+        elif comment > 0 and label == 1:
+            dshare = totshare * comment / netvalues[p]
+            share += dshare
+            rem = _fastbuy(rem, dshare, date)
+    return rdate, cash, share, rem
+
+
+class _tradestate():
+    '''
+    the cashflow calculation state of one trade aim. Instead of walking through every calendar day,
+    it jumps directly between event days, namely days with nonzero records in status table and special days
+    (fenhong or zhesuan) of the aim, and yields new rows of cftable and remtable one by one.
+    Such states of different funds can be advanced together in chronological order, see :func:`batchtrade`.
+
+    :param aim: info obj
+    :param status: status table with date column and the column of aim code
+    :param lastdate: pd.Timestamp, date of the last row already in cftable, None if cftable is empty
+    :param rem: rem of the last row already in remtable
+    :param totshare: float, total share of the rows already in cftable
+    :param precision: string, 'exact' or 'fast', see :class:`trade`
+    '''
+
+    def __init__(self, aim, status, lastdate=None, rem=None, totshare=0, precision='exact'):
+        code = aim.code
+        self.aim = aim
+        self.prices = _pricearrays(aim) if precision == 'fast' else None
+        nonzero = status[status[code] != 0]
+        self.first = None
+        if lastdate is None and len(nonzero) > 0:
+            self.first = (nonzero.iloc[0].date, nonzero.iloc[0].loc[code])
+        # the record of the first row on the date counts, as long as any row on the date is nonzero
+        firstrows = status.drop_duplicates(subset='date', keep='first')
+        firstrows = firstrows[firstrows['date'].isin(nonzero['date'])]
+        zhesuan = set(aim.zhesuandate)
+        # keep numpy float of records, as the rounding of fenhong reinvest mark relies on it
+        self.records = {date: value for date, value in zip(firstrows['date'], firstrows[code].values)
+                        if date not in zhesuan}
+        self.dates = sorted(set(firstrows['date']) | set(aim.specialdate))
+        self.i = 0
+        self.lastdate = lastdate
+        self.rem = [] if rem is None else rem
+        self.totshare = totshare
+        self.end = yesterdayobj()
+        self.lastpricedate = aim.price['date'].max()
+        self.rows = []
+
+    def nextdate(self):
+        '''
+        :returns: pd.Timestamp of the next event day, or None if there is no more event until yesterday
+        '''
+        if self.first is not None:
+            return self.first[0]
+        if self.lastdate is None:
+            return None
+        while self.i < len(self.dates) and self.dates[self.i] <= self.lastdate:
+            self.i += 1
+        if self.i == len(self.dates):
+            return None
+        date = self.dates[self.i]
+        if date <= self.end or (date - self.lastdate).days == 1:
+            return date
+        return None
+
+    def step(self):
+        '''
+        deal with the next event day, and append the new row to self.rows
+        '''
+        first = self.first is not None
+        if first:
+            date, value = self.first
+            self.first = None
+            if value <= 0:
+                raise Exception("You cannot sell first when you never buy")
+        else:
+            date = self.nextdate()
+            value = self.records.get(date)
+        if value and date > self.lastpricedate:
+            # there is no netvalue to trade with, instead of filling it on the last day over and over again
+            raise Exception('no netvalue of %s on or after %s' % (self.aim.code, date.strftime('%Y-%m-%d')))
+        if first:
+            rdate, cash, share, rem = self._firstevent(date, value)
+        else:
+            rdate, cash, share, rem = self._event(date, value)
+        self.rows.append((rdate, cash, share, rem))
+        self.lastdate = rdate
+        self.rem = rem
+        self.totshare = self.totshare + share
+
+    def _firstevent(self, date, value):
+        '''
+        the first purchase, with neither fenhong reinvest mark nor special day considered
+
+        :returns: the same as :func:`_tradeevent`
+        '''
+        if self.prices is not None:
+            return _fasttradeevent(self.aim, self.prices, date, value, [], 0, first=True)
+        rdate, cash, share = self.aim.shengou(value, date)
+        return rdate, cash, share, rm.buy([], share, rdate)
+
+    def _event(self, date, value):
+        '''
+        the trade and special day of aim on one event day after the first purchase
+
+        :returns: the same as :func:`_tradeevent`
+        '''
+        if self.prices is not None:
+            return _fasttradeevent(self.aim, self.prices, date, value, self.rem, self.totshare)
+        return _tradeevent(self.aim, date, value, self.rem, self.totshare)
+
+
+def batchtrade(infoobjs, status, snapshot=None, precision='exact'):
+    '''
+    build trade objs for many funds on one status table together. All funds are advanced in one chronological pass
+    over their event days, and the cftable and remtable of each fund are generated at once in the end.
+    The results are the same as trade(infoobj, status) for each infoobj.
+
+    :param infoobjs: list of info obj, whose codes are columns of status table
+    :param status: status table, obtained from record class
+    :param snapshot: string, optional, the file path prefix of the trade snapshots, see :class:`trade`
+    :param precision: string, 'exact' or 'fast', see :class:`trade`
+    :returns: list of trade obj in the same order of infoobjs
+    '''
+    trades = [trade(infoobj, status, _build=False, precision=precision) for infoobj in infoobjs]
+    todo = [t for t in trades if snapshot is None or not t._fetch_snapshot(snapshot)]
+    states = [t._state() for t in todo]
+    queue = [(state.nextdate(), i) for i, state in enumerate(states)]
+    queue = [item for item in queue if item[0] is not None]
+    heapq.heapify(queue)
+    while queue:
+        _, i = heapq.heappop(queue)
+        states[i].step()
+        date = states[i].nextdate()
+        if date is not None:
+            heapq.heappush(queue, (date, i))
+    for t, state in zip(todo, states):
+        t._appendrows(state.rows)
+        if snapshot is not None:
+            t._save_snapshot(snapshot)
+    return trades
+
+
 class trade():
     '''
     Trade class with fundinfo obj as input and its main attrs are cftable and remtable:
@@ -114,120 +485,158 @@ class trade():
 
     :param infoobj: info object as the trading aim
     :param status: status table, obtained from record class
+    :param snapshot: string, optional, the file path prefix of the snapshot, the snapshot is saved as
+        snapshot+code+'.pkl'. If the snapshot exists and is built on the same status column, price table and fee
+        info, cftable and remtable are loaded directly from it, otherwise they are calculated and saved to it.
+    :param precision: string, 'exact' (default) or 'fast'. The exact mode follows the rounding rules of funds to the
+        cent, namely the share of purchase and the cash of every redeemed lot are rounded, label=2 funds round the
+        share down. The fast mode is for screening many hypothetical portfolios: cash and share are in plain float
+        arithmetic, lots are sold in float and the redemption fee of all sold lots is summed in one dot product.
+        Both modes share the same trade days and fee rates, so they only differ in rounding: every purchase or
+        reinvestment row differs in share by less than 0.005 + 0.005/netvalue (0.01 + 0.005/netvalue for label=2),
+        and every redemption row differs in cash by less than 0.005 per sold lot together with the netvalue times
+        the share difference accumulated so far, which is scaled by the zhesuan factors in between.
     '''
 
-    def __init__(self, infoobj, status):
+    def __init__(self, infoobj, status, snapshot=None, _build=True, precision='exact'):
+        if precision not in ['exact', 'fast']:
+            raise Exception('no such precision option: %s' % precision)
         self.aim = infoobj
+        self.precision = precision
         code = self.aim.code
         self.cftable = pd.DataFrame([], columns=['date', 'cash', 'share'])
         self.remtable = pd.DataFrame([], columns=['date', 'rem'])
         self.status = status.loc[:, ['date', code]]
-        self._arrange()
+        if not _build:  # the tables are filled by batchtrade
+            return
+        if snapshot is None:
+            self._arrange()
+        elif not self._fetch_snapshot(snapshot):
+            self._arrange()
+            self._save_snapshot(snapshot)
 
     def _arrange(self):
-        while (1):
-            try:
-                self._addrow()
-            except Exception as e:
-                if e.args[0] == 'no other info to be add into cashflow table':
-                    break
-                else:
-                    raise e
+        '''
+        calculate the cftable and remtable rows after the last row in cftable, see :class:`_tradestate`
+        '''
+        state = self._state()
+        while state.nextdate() is not None:
+            state.step()
+        self._appendrows(state.rows)
 
-    def _addrow(self):
+    def _state(self):
         '''
-        Return cashflow table with one more line or raise an exception if there is no more line to add
-        The same logic also applies to rem table
-        关于对于一个基金多个操作存在于同一交易日的说明：无法处理历史买入第一笔同时是分红日的情形, 事实上也不存在这种情形。无法处理一日多笔买卖的情形。
-        同一日既有卖也有买不现实，多笔买入只能在 csv 上合并记录，由此可能引起份额计算 0.01 的误差。可以处理分红日买入卖出的情形。
-        分级份额折算日封闭无法买入，所以程序直接忽略当天的买卖。因此不会出现多个操作共存的情形。
+        the :class:`_tradestate` obj continuing from the last row of cftable
         '''
-        # the design on data remtable is disaster, it is very dangerous though works now
+        if len(self.cftable) == 0:
+            return _tradestate(self.aim, self.status, precision=self.precision)
+        return _tradestate(self.aim, self.status, lastdate=self.cftable.iloc[-1].date,
+                           rem=self.remtable.iloc[-1].rem, totshare=self._cumtable()[1][-1], precision=self.precision)
 
-        code = self.aim.code
+    def _appendrows(self, rows):
+        '''
+        append rows of (date, cash, share, rem) to cftable and remtable at once
+        '''
+        if not rows:
+            return
+        cfrows = pd.DataFrame([row[:3] for row in rows], columns=['date', 'cash', 'share'])
+        remrows = pd.DataFrame({'date': [row[0] for row in rows], 'rem': [row[3] for row in rows]},
+                               columns=['date', 'rem'])
         if len(self.cftable) == 0:
-            if len(self.status[self.status[code] != 0]) == 0:
-                raise Exception("no other info to be add into cashflow table")
-            i = 0
-            while (self.status.iloc[i].loc[code] == 0):
-                i += 1
-            value = self.status.iloc[i].loc[code]
-            date = self.status.iloc[i].date
-            if value > 0:
-                rdate, cash, share = self.aim.shengou(value, date)
-                rem = rm.buy([], share, rdate)
-            else:
-                raise Exception("You cannot sell first when you never buy")
-        elif len(self.cftable) > 0:
-            recorddate = list(self.status.date)
-            lastdate = self.cftable.iloc[-1].date + pd.Timedelta(1, unit='d')
-            while ((lastdate not in self.aim.specialdate) and ((lastdate not in recorddate)
-                                                               or ((lastdate in recorddate)
-                                                                   and (self.status[
-                                                                            self.status['date'] == lastdate].loc[:,
-                                                                        code].any() == 0)))):
-                lastdate += pd.Timedelta(1, unit='d')
-                if (lastdate - yesterdayobj()).days >= 1:
-                    raise Exception("no other info to be add into cashflow table")
-            date = lastdate
-            label = 0
-            cash = 0
-            share = 0
-            rem = self.remtable.iloc[-1].rem
-            rdate = date
-
-            if (date in recorddate) and (date not in self.aim.zhesuandate):
-                # deal with buy and sell and label the fenhongzaitouru, namely one label a 0.05 in the original table to label fenhongzaitouru
-                value = self.status[self.status['date'] == date].iloc[0].loc[code]
-                fenhongmark = round(10 * value - int(10 * value), 1)
-                if fenhongmark == 0.5:
-                    label = 1  # fenhong reinvest
-                    value = round(value, 1)
-
-                if value > 0:  # value stands for purchase money
-                    rdate, dcash, dshare = self.aim.shengou(value, date)
-                    rem = rm.buy(rem, dshare, rdate)
-
-                elif value < -0.005:  # value stands for redemp share
-                    rdate, dcash, dshare = self.aim.shuhui(-value, date, self.remtable.iloc[-1].rem)
-                    _, rem = rm.sell(rem, -dshare, rdate)
-                elif value >= -0.005 and value < 0:
-                    # value now stands for the ratio to be sold in terms of remain positions, -0.005 stand for sell 100%
-                    remainshare = sum(self.cftable.loc[:, 'share'])
-                    ratio = -value / 0.005
-                    rdate, dcash, dshare = self.aim.shuhui(remainshare * ratio, date, self.remtable.iloc[-1].rem)
-                    _, rem = rm.sell(rem, -dshare, rdate)
-                else:  # in case value=0, when specialday is in record day
-                    rdate, dcash, dshare = date, 0, 0
-
-                cash += dcash
-                share += dshare
-            if date in self.aim.specialdate:  # deal with fenhong and xiazhe
-                comment = self.aim.price[self.aim.price['date'] == date].iloc[0].loc['comment']
-                if isinstance(comment, float):
-                    if comment < 0:
-                        dcash2, dshare2 = 0, sum([myround(sh * (-comment - 1)) for _, sh in
-                                                  rem])  # xiazhe are seperately carried out based on different purchase date
-                        rem = rm.trans(rem, -comment, date)
-                        # myround(sum(cftable.loc[:,'share'])*(-comment-1))
-                    elif comment > 0 and label == 0:
-                        dcash2, dshare2 = myround(sum(self.cftable.loc[:, 'share']) * comment), 0
-                        rem = rm.copy(rem)
-
-                    elif comment > 0 and label == 1:
-                        dcash2, dshare2 = 0, myround(sum(self.cftable.loc[:, 'share']) *
-                                                     (comment / self.aim.price[self.aim.price['date'] == date].iloc[
-                                                         0].netvalue))
-                        rem = rm.buy(rem, dshare2, date)
-
-                    cash += dcash2
-                    share += dshare2
-                else:
-                    raise Exception('comments not recoginized')
-
-        self.cftable = self.cftable.append(pd.DataFrame([[rdate, cash, share]], columns=['date', 'cash', 'share']),
-                                           ignore_index=True)
-        self.remtable = self.remtable.append(pd.DataFrame([[rdate, rem]], columns=['date', 'rem']), ignore_index=True)
+            self.cftable = cfrows
+            self.remtable = remrows
+        else:
+            self.cftable = self.cftable.append(cfrows, ignore_index=True)
+            self.remtable = self.remtable.append(remrows, ignore_index=True)
+
+    def _cumtable(self):
+        '''
+        cumulative arrays along cftable, they are extended by the new rows only when cftable grows,
+        and recalculated if cftable is replaced by a shorter one.
+
+        :returns: tuple of three np.array, dates of cftable in datetime64, cumulative share and cumulative cash
+        '''
+        n = len(self.cftable)
+        cum = getattr(self, '_cum', None)
+        if cum is None or len(cum[0]) > n:
+            cum = (np.array([], dtype='datetime64[ns]'), np.array([], dtype='float64'), np.array([], dtype='float64'))
+        m = len(cum[0])
+        if m < n:
+            new = self.cftable.iloc[m:]
+            # keep the accumulation order the same as summing from the first row
+            cumshare = np.cumsum(np.concatenate([cum[1][-1:], new['share'].values.astype('float64')]))
+            cumcash = np.cumsum(np.concatenate([cum[2][-1:], new['cash'].values.astype('float64')]))
+            cum = (np.concatenate([cum[0], new['date'].values.astype('datetime64[ns]')]),
+                   np.concatenate([cum[1], cumshare[len(cum[1][-1:]):]]),
+                   np.concatenate([cum[2], cumcash[len(cum[2][-1:]):]]))
+        self._cum = cum
+        return cum
+
+    def extend(self, new_status_rows=None):
+        '''
+        continue the cftable and remtable from the last processed row, instead of rebuilding them from the
+        first day. It is useful when the price table of the aim is updated or new rows are added to the status table.
+        Only the new rows are calculated and appended.
+
+        :param new_status_rows: pd.DataFrame, optional, new rows of status table with date and code columns,
+            all nonzero rows must be later than the last row in the cftable
+        '''
+        if new_status_rows is not None:
+            code = self.aim.code
+            new = new_status_rows.loc[:, ['date', code]]
+            if len(self.cftable) > 0 and len(new[(new[code] != 0) & (new['date'] <= self.cftable.iloc[-1].date)]) > 0:
+                raise Exception('One cannot add status before the lastest operation')
+            self.status = self.status.append(new, ignore_index=True)
+        self._arrange()
+
+    def _snapshotkey(self):
+        '''
+        hash of everything cftable and remtable depend on: the status column, the price table up to its last day,
+        the special days, as well as the purchase and redemption fee schemes of the aim
+        '''
+        aim = self.aim
+        h = hashlib.sha1()
+        h.update(str(_snapshotversion).encode())
+        h.update(pd.util.hash_pandas_object(self.status, index=False).values.tobytes())
+        special = aim.price[aim.price['comment'] != 0]
+        h.update(pd.util.hash_pandas_object(special[['date', 'comment']].astype(str), index=False).values.tobytes())
+        lastrow = aim.price.iloc[-1]
+        feeinfo = {'code': aim.code, 'len': len(aim.price), 'lastdate': str(lastrow.date),
+                   'lastvalue': float(lastrow.netvalue), 'rate': aim.rate, 'label': aim.label,
+                   'segment': getattr(aim, 'segment', None), 'feeinfo': getattr(aim, 'feeinfo', None)}
+        h.update(json.dumps(feeinfo, sort_keys=True, default=str).encode())
+        if self.precision != 'exact':  # keys of exact snapshots are unchanged
+            h.update(self.precision.encode())
+        return h.hexdigest()
+
+    def _fetch_snapshot(self, path):
+        '''
+        load cftable and remtable from the snapshot file, if it is still valid
+
+        :param path: string of the file path prefix
+        :returns: bool, whether the snapshot is valid and loaded
+        '''
+        try:
+            with open(path + self.aim.code + '.pkl', 'rb') as f:
+                snap = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return False
+        if snap.get('version') != _snapshotversion or snap.get('key') != self._snapshotkey():
+            return False
+        self.cftable = snap['cftable']
+        self.remtable = snap['remtable']
+        return True
+
+    def _save_snapshot(self, path):
+        '''
+        save cftable and remtable into the snapshot file, together with the hash key of the inputs
+
+        :param path: string of the file path prefix
+        '''
+        snap = {'version': _snapshotversion, 'key': self._snapshotkey(),
+                'cftable': self.cftable, 'remtable': self.remtable}
+        with open(path + self.aim.code + '.pkl', 'wb') as f:
+            pickle.dump(snap, f, protocol=pickle.HIGHEST_PROTOCOL)
 
     def xirrrate(self, date=yesterdayobj(), guess=0.1):
         '''
@@ -237,6 +646,44 @@ class trade():
         '''
         return xirrcal(self.cftable, [self], date, guess)
 
+    def _liquidation(self, dates):
+        '''
+        the cash of virtually selling all holding positions on each date, the same as the sell-all cash in xirrcal
+
+        :param dates: DatetimeIndex
+        :returns: np.array of float, 0 for dates before any trade
+        '''
+        dates = dates.values
+        cumdate, cumshare, _ = self._cumtable()
+        ks = np.searchsorted(cumdate, dates, side='right')
+        rs = np.searchsorted(self.remtable['date'].values.astype('datetime64[ns]'), dates, side='right')
+        pricedates = self.aim.price['date'].values.astype('datetime64[ns]')
+        netvalues = self.aim.price['netvalue'].values
+        # the first trade day no earlier than date, or the last trade day if date is beyond the price table
+        ps = np.minimum(np.searchsorted(pricedates, dates, side='left'), len(pricedates) - 1)
+        rems = self.remtable['rem'].values
+        res = np.zeros(len(dates))
+        for j, (k, r, p) in enumerate(zip(ks, rs, ps)):
+            if r == 0:
+                continue
+            share = myround(cumshare[k - 1]) if k > 0 else 0
+            res[j] = self.aim._shuhuivalue(share, pd.Timestamp(dates[j]), pd.Timestamp(pricedates[p]), netvalues[p],
+                                           rems[r - 1])[1]
+        return res
+
+    def xirr_series(self, dates, guess=0.1):
+        '''
+        give the xirr rates on a series of dates, much faster than calling xirrrate on each date
+
+        :param dates: list of string or obj of datetime, the virtually sell-all dates
+        :param guess: floating number, the starting point of the solution on the earliest date
+        :returns: pd.Series of xirr rates indexed by dates
+        '''
+        dates, order = _sorteddates(dates)
+        rates = np.zeros(len(dates))
+        rates[order] = xirrseries(self.cftable, dates[order], self._liquidation(dates[order]), guess)
+        return pd.Series(rates, index=dates, name='xirr')
+
     def dailyreport(self, date=yesterdayobj()):
         '''
         breif report dict of certain date status on the fund investment
@@ -245,37 +692,52 @@ class trade():
         :returns: dict of various data on the trade positions
         '''
         date = convert_date(date)
-        partcftb = self.cftable[self.cftable['date'] <= date]
-        value = self.aim.price[self.aim.price['date'] <= date].iloc[-1].netvalue
-
-        if len(partcftb) == 0:
-            reportdict = {'基金名称': [self.aim.name], '基金代码': [self.aim.code], '当日净值': [value], '持有份额': [0],
-                          '基金现值': [0], '基金总申购': [0], '历史最大占用': [0], '基金分红与赎回': [0], '基金收益总额': [0]}
-            df = pd.DataFrame(reportdict, columns=reportdict.keys())
-            return df
-        # totinput = myround(-sum(partcftb.loc[:,'cash']))
-        totinput = myround(-sum([row['cash'] for _, row in partcftb.iterrows() if row['cash'] < 0]))
-        totoutput = myround(sum([row['cash'] for _, row in partcftb.iterrows() if row['cash'] > 0]))
-
-        currentshare = myround(sum(partcftb.loc[:, 'share']))
-        currentcash = myround(currentshare * value)
-        btnk = bottleneck(partcftb)
-        turnover = turnoverrate(partcftb, date)
-        ereturn = myround(currentcash + totoutput - totinput)
-        if currentshare == 0:
-            unitcost = 0
-        else:
-            unitcost = round((totinput - totoutput) / currentshare, 4)
-        if btnk == 0:
-            returnrate = 0
-        else:
-            returnrate = round((ereturn / btnk) * 100, 4)
+        df = self._dailyreports(pd.DatetimeIndex([date])).reset_index(drop=True)
+        if len(self.cftable) == 0 or self.cftable.iloc[0].date > date:
+            return df[['基金名称', '基金代码', '当日净值', '持有份额', '基金现值', '基金总申购', '历史最大占用', '基金分红与赎回',
+                       '基金收益总额']]
+        return df
+
+    def _dailyreports(self, dates):
+        '''
+        vectorized dailyreport on a series of dates, from the cumulative sums along cftable
 
-        reportdict = {'基金名称': [self.aim.name], '基金代码': [self.aim.code], '当日净值': [value], '单位成本': [unitcost],
-                      '持有份额': [currentshare], '基金现值': [currentcash], '基金总申购': [totinput], '历史最大占用': [btnk],
-                      '基金持有成本': [totinput - totoutput],
-                      '基金分红与赎回': [totoutput], '换手率': [turnover], '基金收益总额': [ereturn], '投资收益率': [returnrate]}
-        df = pd.DataFrame(reportdict, columns=reportdict.keys())
+        :param dates: sorted DatetimeIndex
+        :returns: pd.DataFrame indexed by dates with the same columns as dailyreport,
+            on dates before the first trade, the columns on cost and rates are nan while the others are zero
+        '''
+        n = len(dates)
+        ks, btnk, turnover = _prefixreports(self.cftable, dates)
+        pricedates = self.aim.price['date'].values.astype('datetime64[ns]')
+        ps = np.searchsorted(pricedates, dates.values, side='right') - 1
+        value = np.where(ps >= 0, self.aim.price['netvalue'].values[ps], np.nan)
+        zeros = ['持有份额', '基金现值', '基金总申购', '历史最大占用', '基金分红与赎回', '基金收益总额']
+        report = {col: np.zeros(n) if col in zeros else np.full(n, np.nan) for col in
+                  ['单位成本', '持有份额', '基金现值', '基金总申购', '历史最大占用', '基金持有成本', '基金分红与赎回', '换手率',
+                   '基金收益总额', '投资收益率']}
+        valid = ks > 0
+        if valid.any():
+            k1 = ks[valid] - 1
+            _, cumshare, _ = self._cumtable()
+            cash = self.cftable['cash'].values.astype('float64')
+            totinput = fromcents(tocents(-np.cumsum(np.where(cash < 0, cash, 0.))[k1]))
+            totoutput = fromcents(tocents(np.cumsum(np.where(cash > 0, cash, 0.))[k1]))
+            currentshare = fromcents(tocents(cumshare[k1]))
+            currentcash = fromcents(tocents(currentshare * value[valid]))
+            ereturn = fromcents(tocents(currentcash + totoutput - totinput))
+            # python round on python floats, the same as the scalar report
+            unitcost = [0 if sh == 0 else round(float(c / sh), 4)
+                        for c, sh in zip(totinput - totoutput, currentshare)]
+            returnrate = [0 if b == 0 else round(float((e / b) * 100), 4) for e, b in zip(ereturn, btnk[valid])]
+            for col, arr in [('单位成本', unitcost), ('持有份额', currentshare), ('基金现值', currentcash),
+                             ('基金总申购', totinput), ('历史最大占用', btnk[valid]), ('基金持有成本', totinput - totoutput),
+                             ('基金分红与赎回', totoutput), ('换手率', turnover[valid]), ('基金收益总额', ereturn),
+                             ('投资收益率', returnrate)]:
+                report[col][valid] = arr
+        df = pd.DataFrame(report, index=dates)
+        df.insert(0, '当日净值', value)
+        df.insert(0, '基金代码', self.aim.code)
+        df.insert(0, '基金名称', self.aim.name)
         return df
 
     def briefdailyreport(self, date=yesterdayobj()):
@@ -286,17 +748,108 @@ class trade():
         :returns: dict with several attrs: date, unitvalue, currentshare, currentvalue
         '''
         date = convert_date(date)
-        partcftb = self.cftable[self.cftable['date'] <= date]
-        if len(partcftb) == 0:
+        cumdate, cumshare, _ = self._cumtable()
+        i = np.searchsorted(cumdate, np.datetime64(date, 'ns'), side='right')
+        if i == 0:
             return {}
 
         unitvalue = self.aim.price[self.aim.price['date'] <= date].iloc[-1].netvalue
-        currentshare = myround(sum(partcftb.loc[:, 'share']))
+        currentshare = myround(cumshare[i - 1])
         currentvalue = myround(currentshare * unitvalue)
 
         return {'date': date, 'unitvalue': unitvalue, 'currentshare': currentshare,
                 'currentvalue': currentvalue}
 
+    def _currentvalues(self, dates):
+        '''
+        vectorized currentvalue of briefdailyreport on sorted dates
+
+        :param dates: sorted DatetimeIndex
+        :returns: np.array of float, 0 for dates before the first trade
+        '''
+        cumdate, cumshare, _ = self._cumtable()
+        ks = np.searchsorted(cumdate, dates.values, side='right')
+        res = np.zeros(len(dates))
+        valid = ks > 0
+        if valid.any():
+            pricedates = self.aim.price['date'].values.astype('datetime64[ns]')
+            ps = np.searchsorted(pricedates, dates.values[valid], side='right') - 1
+            currentshare = fromcents(tocents(cumshare[ks[valid] - 1]))
+            res[valid] = fromcents(tocents(currentshare * self.aim.price['netvalue'].values[ps]))
+        return res
+
+    def _pnlrows(self):
+        '''
+        split every row of cftable into the trade part and the fenhong part as the trade engine does,
+        and track the holding cost along the rows. The holding cost is the market value of shares when they are
+        bought or reinvested, reduced proportionally on redemption, so that fees and dividends are not counted twice.
+
+        :returns: tuple of np.array along cftable rows, (dividend, realized, fee)
+        '''
+        n = len(self.cftable)
+        cash = self.cftable['cash'].values.astype('float64')
+        share = self.cftable['share'].values.astype('float64')
+        _, cumshare, _ = self._cumtable()
+        held = np.concatenate([[0.], cumshare[:-1]])  # total share before each row
+        pricedates = self.aim.price['date'].values.astype('datetime64[ns]')
+        ps = np.maximum(np.searchsorted(pricedates, self.cftable['date'].values.astype('datetime64[ns]'),
+                                        side='right') - 1, 0)
+        netvalue = self.aim.price['netvalue'].values[ps].astype('float64')
+        divcash, divshare, zsshare = np.zeros(n), np.zeros(n), np.zeros(n)
+        fenhong, zhesuan = set(self.aim.fenhongdate), set(self.aim.zhesuandate)
+        if fenhong or zhesuan:
+            firstrows = self.status.drop_duplicates(subset='date', keep='first')
+            records = dict(zip(firstrows['date'], firstrows[self.aim.code].values))
+            for i, date in enumerate(self.cftable['date']):
+                if date in zhesuan:  # trades are ignored on zhesuan days
+                    zsshare[i] = share[i]
+                elif date in fenhong:
+                    comment = self.aim.price['comment'].values[ps[i]]
+                    value = records.get(date, 0)
+                    if round(10 * value - int(10 * value), 1) == 0.5:  # fenhong reinvest
+                        divshare[i] = myround(held[i] * (comment / netvalue[i]))
+                    else:
+                        divcash[i] = myround(held[i] * comment)
+        tradeshare = share - divshare - zsshare
+        dividend = divcash + divshare * netvalue
+        fee = cash - divcash + tradeshare * netvalue
+        realized = np.zeros(n)
+        c = 0.
+        for i in range(n):  # one step per cftable row instead of per day
+            if tradeshare[i] > 0:
+                c += tradeshare[i] * netvalue[i]
+            elif tradeshare[i] < 0 and held[i] > 0:
+                part = c * min(-tradeshare[i] / held[i], 1)
+                realized[i] = -tradeshare[i] * netvalue[i] - part
+                c -= part
+            c += divshare[i] * netvalue[i]
+        return dividend, realized, fee
+
+    def _pnl(self, dates, rows=None):
+        '''
+        pnl attribution on each day, see :meth:`xalpha.multiple.mul.pnl_attribution`
+
+        :param dates: sorted DatetimeIndex, the first date is the reference day before the attribution
+        :param rows: the result of :meth:`_pnlrows`, recalculated if not given
+        :returns: np.array of shape (len(dates)-1, 4), with columns price, dividend, realized and fee
+        '''
+        if rows is None:
+            rows = self._pnlrows()
+        dividend, realized, fee = rows
+        cumdate, _, _ = self._cumtable()
+        values = self._currentvalues(dates)
+        # cftable rows in (dates[j-1], dates[j]] belong to the day j
+        js = np.searchsorted(dates.values, cumdate, side='left')
+        inside = (js >= 1) & (js < len(dates))
+        res = np.zeros((len(dates) - 1, 4))
+        cash = np.zeros(len(dates) - 1)
+        np.add.at(cash, js[inside] - 1, self.cftable['cash'].values.astype('float64')[inside])
+        for col, arr in [(1, dividend), (2, realized), (3, fee)]:
+            np.add.at(res[:, col], js[inside] - 1, arr[inside])
+        # the change of floating profit, value minus holding cost, is the rest of the pnl
+        res[:, 0] = np.diff(values) + cash - res[:, 1] - res[:, 2] - res[:, 3]
+        return res
+
     def unitcost(self, date=yesterdayobj()):
         '''
         give the unitcost of fund positions
@@ -304,12 +857,13 @@ class trade():
         :param date: string or object of datetime
         :returns: float number of unitcost
         '''
-        partcftb = self.cftable[self.cftable['date'] <= date]
-        if len(partcftb) == 0:
+        date = convert_date(date)
+        cumdate, _, cumcash = self._cumtable()
+        i = np.searchsorted(cumdate, np.datetime64(date, 'ns'), side='right')
+        if i == 0:
             return 0
-        totnetinput = myround(-sum(partcftb.loc[:, 'cash']))
+        totnetinput = myround(-cumcash[i - 1])
         currentshare = self.briefdailyreport(date).get('currentshare', 0)
-        totnetinput
         if currentshare > 0:
             unitcost = totnetinput / currentshare
         else:
@@ -373,6 +927,79 @@ class trade():
         return self.aim.name + ' 交易情况'
 
 
+class cashledger(trade):
+    '''
+    the virtual cash account of mulfix, it behaves like a trade obj on cashinfo with a status table of the mf column,
+    where the money taken by fund purchases is redeemed from the cash and the money back from funds is put into the
+    cash. Instead of running such status table through the trade engine, the cftable is computed directly in one pass,
+    since cash has no fee and no special day. All cash positions are kept as one lot in the remtable, and the amounts
+    are taken as they are, namely there is no fenhong reinvest mark for cash.
+
+    :param cashobj: cashinfo object
+    :param totmoney: positive float, the total money as the input at the beginning
+    :param totcftable: the merged cftable of funds, with date and cash columns
+    '''
+
+    def __init__(self, cashobj, totmoney, totcftable):
+        super().__init__(cashobj, cashledger._vstatus(totmoney, totcftable, cashobj), _build=False)
+        self._arrange()
+
+    def _vstatus(totmoney, totcftable, cashobj):
+        '''
+        return a virtue status table with a mf(cash) column based on the given tot money and cftable,
+        positive values are the money put into cash while negative values are the shares of cash redeemed
+        '''
+        cash = totcftable['cash'].values.astype('float64')
+        pricedates = cashobj.price['date'].values.astype('datetime64[ns]')
+        ps = np.searchsorted(pricedates, totcftable['date'].values.astype('datetime64[ns]'), side='right') - 1
+        if (ps[1:][cash[1:] < 0] < 0).any():
+            raise Exception('the cash account starts later than the fund purchase')
+        with np.errstate(all='ignore'):
+            mf = np.where(cash < 0, fromcents(tocents(cash / cashobj.price['netvalue'].values[ps])), cash)
+        if len(mf) > 0:
+            mf[0] = totmoney + cash[0]
+        return pd.DataFrame(data={'date': totcftable['date'].values, 'mf': mf})
+
+    def _arrange(self):
+        '''
+        calculate the whole cftable and remtable from the status table
+        '''
+        status = self.status[self.status['mf'] != 0]
+        if len(status) > 0 and status.iloc[0].mf < 0:
+            raise Exception("You cannot sell first when you never buy")
+        pricedates = self.aim.price['date'].values.astype('datetime64[ns]')
+        netvalues = self.aim.price['netvalue'].values
+        # trade on the first day no earlier than the record
+        ps = np.searchsorted(pricedates, status['date'].values.astype('datetime64[ns]'), side='left')
+        if len(ps) > 0 and ps[-1] == len(pricedates):
+            date = pd.Timestamp(status['date'].values[ps == len(pricedates)][0])
+            raise Exception('no netvalue of %s on or after %s' % (self.aim.code, date.strftime('%Y-%m-%d')))
+        values = status['mf'].values
+        buy = values > 0
+        buycash = fromcents(tocents(values))
+        buyshare = fromcents(tocents(buycash / netvalues[ps], self.aim.label))
+        rows = []
+        held = 0
+        firstdate = None
+        for i, p in enumerate(ps):
+            rdate = pd.Timestamp(pricedates[p])
+            if buy[i]:
+                cash, share = -buycash[i], buyshare[i]
+                if firstdate is None:
+                    firstdate = rdate
+            else:
+                sh = min(-values[i], held)  # not raise error when you sell more than you have
+                cash, share = myround(sh * netvalues[p]), -myround(sh)
+            held = myround(held + share)
+            if held <= 0:  # the cash runs out, the next purchase starts a new lot
+                firstdate = None
+            rows.append((rdate, cash, share, [[firstdate, held]] if held > 0 else []))
+        self.cftable = pd.DataFrame([], columns=['date', 'cash', 'share'])
+        self.remtable = pd.DataFrame([], columns=['date', 'rem'])
+        self._cum = None
+        self._appendrows(rows)
+
+
 '''
 可视化图的合并可参考以下代码
 from pyecharts import Overlap